@@ -0,0 +1,90 @@
+#! /usr/bin/env python
+__author__ = 'Andrew Boughton and the A2 Hack for Change team'
+
+# Benchmark the crawler against a local FakeMMWRServer: the serial crawl plus a few concurrent configurations, each
+# crawling the same range of weeks into a fresh temporary folder. Reports throughput (files and requests per second)
+# and tail latency for each.
+#
+# Example:
+#   python benchmark_crawl.py --startyear 2007 --endyear 2008 --latency 0.05 --jitter 0.05 --error-rate 0.01
+
+import argparse
+import shutil
+import tempfile
+
+from fetch_cdc_tables import CrawlTables
+from fake_mmwr_server import FakeMMWRServer
+from request_scheduler import RequestScheduler
+
+# (name, extra CrawlTables arguments). Schedulers are made fresh for each run, since they keep state.
+CONFIGURATIONS = [('serial', lambda: {}),
+                  ('4 workers', lambda: {'workers': 4, 'max_per_host': 4}),
+                  ('8 workers', lambda: {'workers': 8, 'max_per_host': 8}),
+                  ('16 workers', lambda: {'workers': 16, 'max_per_host': 16}),
+                  ('8 workers + scheduler', lambda: {'workers': 8, 'max_per_host': 8,
+                                                     'scheduler': RequestScheduler(rate=20, max_rate=1000,
+                                                                                   backoff_base=0.1)})]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float('nan')
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def run_benchmark(base_url, startyear, endyear, startweek, endweek, name, crawl_kwargs):
+    """
+    Crawl once with the given CrawlTables arguments and return a dict of measurements
+    """
+    output_dir = tempfile.mkdtemp(prefix='mmwr_bench_')
+    try:
+        crawled = CrawlTables(startyear=startyear, endyear=endyear, startweek=startweek, endweek=endweek,
+                              output_dir=output_dir, base_url=base_url, **crawl_kwargs)
+    finally:
+        shutil.rmtree(output_dir)
+
+    elapsed = crawled.finished - crawled.started
+    latencies = sorted(crawled.session.latencies)
+    return {'name': name,
+            'elapsed': elapsed,
+            'files': crawled.stats['files_written'],
+            'failures': len(crawled.failures),
+            'requests': crawled.session.stats['requests'],
+            'files_per_s': crawled.stats['files_written'] / elapsed,
+            'requests_per_s': crawled.session.stats['requests'] / elapsed,
+            'p50': percentile(latencies, 0.50),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99)}
+
+
+def print_results(results):
+    print '{0:<24}{1:>9}{2:>7}{3:>7}{4:>9}{5:>9}{6:>9}{7:>9}{8:>9}'.format(
+        'configuration', 'time (s)', 'files', 'fails', 'files/s', 'req/s', 'p50 (s)', 'p95 (s)', 'p99 (s)')
+    for r in results:
+        print '{name:<24}{elapsed:>9.2f}{files:>7}{failures:>7}{files_per_s:>9.1f}{requests_per_s:>9.1f}' \
+              '{p50:>9.3f}{p95:>9.3f}{p99:>9.3f}'.format(**r)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the MMWR crawler against a local fake server')
+    parser.add_argument('--startyear', type=int, default=2008)
+    parser.add_argument('--endyear', type=int, default=2008)
+    parser.add_argument('--startweek', type=int, default=1)
+    parser.add_argument('--endweek', type=int, default=12)
+    parser.add_argument('--corpus', help='folder of .tab files for the fake server to serve (default: made up)')
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds of server delay per request')
+    parser.add_argument('--jitter', type=float, default=0.02, help='up to this many extra seconds of random delay')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests that fail with HTTP 500')
+    parser.add_argument('--only', action='append', help='run only the named configuration(s)')
+    args = parser.parse_args()
+
+    server = FakeMMWRServer(corpus_dir=args.corpus, latency=args.latency, latency_jitter=args.jitter,
+                            error_rate=args.error_rate, seed=0)
+    base_url = server.start()
+    try:
+        results = [run_benchmark(base_url, args.startyear, args.endyear, args.startweek, args.endweek, name, kwargs())
+                   for name, kwargs in CONFIGURATIONS if not args.only or name in args.only]
+    finally:
+        server.stop()
+
+    print_results(results)
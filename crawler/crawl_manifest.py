@@ -0,0 +1,109 @@
+__author__ = 'Andrew Boughton and the A2 Hack for Change team'
+
+import datetime
+import hashlib
+import json
+import os
+import threading
+
+
+class CrawlManifest(object):
+    """
+    On-disk record of what the crawler has already fetched, so that an interrupted or repeated crawl only has to
+    fetch what is missing. For every (year, week, table) it keeps the status of the last attempt ('complete' or
+    'failed'), plus the size and sha1 of the file that was written and when it was fetched. It also remembers the list
+    of tables published each week, so a week that is already complete doesn't even need its table list re-fetched.
+
+    The manifest file holds one JSON record per line and is only ever appended to (a later record for the same
+    table replaces an earlier one when the file is read back), so a crawl that dies halfway through loses at most the
+    line it was writing.
+    """
+
+    def __init__(self, filename='crawl_manifest.jsonl'):
+        """
+        Load the manifest from the specified file, if it exists. New records are appended to the same file.
+        :param filename: Where the manifest lives. Typically kept alongside the .tab files it describes.
+        """
+        self.filename = filename
+        self.weeks = {}
+        self.tables = {}
+        self._lock = threading.Lock()
+
+        if os.path.exists(filename):
+            self.load()
+
+    def load(self):
+        """
+        Replay the manifest file into memory
+        """
+        with open(self.filename, 'rU') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Partially written line from a crawl that was killed mid-write. Whatever it described will
+                    # simply be fetched again.
+                    continue
+                self._apply(record)
+
+    def _apply(self, record):
+        if record['kind'] == 'week':
+            self.weeks[(record['year'], record['week'])] = record['tables']
+        else:
+            self.tables[(record['year'], record['week'], record['table'])] = record
+
+    def _append(self, record):
+        with self._lock:
+            self._apply(record)
+            with open(self.filename, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+    def record_week(self, year, week, tables):
+        """
+        Remember which tables were published in a given week
+        """
+        self._append({'kind': 'week', 'year': year, 'week': week, 'tables': list(tables)})
+
+    def record_table(self, year, week, tablename, contents=None, error=None):
+        """
+        Record the outcome of fetching one table. Pass the file contents on success, or the exception on failure.
+        """
+        record = {'kind': 'table',
+                  'year': year,
+                  'week': week,
+                  'table': tablename,
+                  'fetched': datetime.datetime.utcnow().isoformat()}
+        if error is None:
+            record.update({'status': 'complete',
+                           'size': len(contents),
+                           'sha1': hashlib.sha1(contents).hexdigest()})
+        else:
+            record.update({'status': 'failed',
+                           'error': repr(error)})
+        self._append(record)
+
+    def week_tables(self, year, week):
+        """
+        The list of tables published in a given week, or None if the week hasn't been looked up yet
+        """
+        return self.weeks.get((year, week))
+
+    def is_complete(self, year, week, tablename, filename=None):
+        """
+        Check whether a table has already been fetched successfully. If a filename is provided, the file must also
+        still be on disk with the recorded size- otherwise it will be fetched again.
+        :rtype : bool
+        """
+        record = self.tables.get((year, week, tablename))
+        if record is None or record['status'] != 'complete':
+            return False
+        if filename is not None:
+            return os.path.exists(filename) and os.path.getsize(filename) == record['size']
+        return True
+
+    def failed(self):
+        """
+        List the (year, week, table) keys whose last fetch attempt failed
+        :rtype : list
+        """
+        return sorted(k for k, record in self.tables.iteritems() if record['status'] == 'failed')
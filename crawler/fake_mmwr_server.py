@@ -0,0 +1,263 @@
+#! /usr/bin/env python
+__author__ = 'Andrew Boughton and the A2 Hack for Change team'
+
+# A local stand-in for the two wonder.cdc.gov pages that the crawler uses, so that CrawlTables can be tested and
+# benchmarked without hammering (or depending on) the CDC servers:
+#   mmwrmorb2.asp?mmwr_year=...&mmwr_week=...                                    list of tables published that week
+#   mmwr_reps.asp?mmwr_year=...&mmwr_week=...&mmwr_table=...&request=Export       tab-delimited table file
+#
+# Tab files are served from a folder of previously crawled files if one is given (the fixture corpus), and otherwise
+# made up on the spot in the same layout as the real thing. Latency, error rate and which years have 53 weeks can all
+# be configured.
+
+import argparse
+import BaseHTTPServer
+import hashlib
+import os
+import random
+import re
+import SocketServer
+import threading
+import sys
+import time
+import urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'parsers'))
+from mmwr_calendar import long_years, week_ending
+
+# MMWR years with a week 53, 1990-2030
+LONG_YEARS = tuple(long_years(1990, 2030))
+
+DEFAULT_TABLES = ('1', '2A', '2B', '2C', '2D', '2E', '2F', '2G', '2H', '2I', '2J')
+
+# Diseases to fill made-up tables with, one per table
+DISEASES = ('Chlamydia trachomatis infection', 'Coccidioidomycosis', 'Cryptosporidiosis', 'Giardiasis',
+            'Gonorrhea', 'Legionellosis', 'Lyme disease', 'Malaria', 'Syphillis, primary & secondary', 'Pertussis',
+            'Salmonellosis', 'Shigellosis')
+
+# Reporting areas, in the order they appear in the published tables
+REPORTING_AREAS = ('UNITED STATES',
+                   'NEW ENGLAND', 'Conn.', 'Maine', 'Mass.', 'N.H.', 'R.I.', 'Vt.',
+                   'MID. ATLANTIC', 'N.J.', 'N.Y. (Upstate)', 'N.Y. City', 'Pa.',
+                   'E.N. CENTRAL', 'Ill.', 'Ind.', 'Mich.', 'Ohio', 'Wis.',
+                   'W.N. CENTRAL', 'Iowa', 'Kans.', 'Minn.', 'Mo.', 'Nebr.', 'N. Dak.', 'S. Dak.',
+                   'S. ATLANTIC', 'Del.', 'D.C.', 'Fla.', 'Ga.', 'Md.', 'N.C.', 'S.C.', 'Va.', 'W. Va.',
+                   'E.S. CENTRAL', 'Ala.', 'Ky.', 'Miss.', 'Tenn.',
+                   'W.S. CENTRAL', 'Ark.', 'La.', 'Okla.', 'Tex.',
+                   'MOUNTAIN', 'Ariz.', 'Colo.', 'Idaho', 'Mont.', 'Nev.', 'N. Mex.', 'Utah', 'Wyo.',
+                   'PACIFIC', 'Alaska', 'Calif.', 'Hawaii', 'Oreg.', 'Wash.',
+                   'Amer. Samoa', 'C.N.M.I.', 'Guam', 'P.R.', 'V.I.')
+
+MONTHS = ('January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October',
+          'November', 'December')
+
+
+def synthesize_tabfile(year, week, tablename):
+    """
+    Make up a tab file with the same layout as the ones published by the CDC (header, column names, data rows,
+    footnotes). The contents are random, but always the same for a given year/week/table.
+    """
+    rng = random.Random('{0}-{1}-{2}'.format(year, week, tablename))
+    disease = DISEASES[DEFAULT_TABLES.index(tablename) % len(DISEASES)] if tablename in DEFAULT_TABLES \
+        else rng.choice(DISEASES)
+    date = week_ending(year, week)
+
+    columns = ['Reporting Area',
+               disease + ' current week',
+               disease + ' previous 52 weeks median ',
+               disease + ' previous 52 weeks maximum ',
+               disease + ' cummulative for {0}'.format(year),
+               disease + ' cummulative for {0}'.format(year - 1)]
+
+    lines = ['',
+             'TABLE II. (Part {0})  Provisional cases of selected notifiable diseases, United States, '
+             'week ending {1} {2}, {3} (WEEK {4:02})*'.format(tablename[1:] or '1', MONTHS[date.month - 1], date.day,
+                                                               date.year, week),
+             '',
+             'Column Names:']
+    lines.extend(columns)
+    lines.extend(['', 'Data:', 'test'])
+
+    for area in REPORTING_AREAS:
+        cells = [area]
+        for i in xrange(len(columns) - 1):
+            roll = rng.random()
+            if roll < 0.05:
+                cells.append('N')
+            elif roll < 0.08:
+                cells.append('U')
+            elif roll < 0.15:
+                cells.append('-')
+            else:
+                cells.append('{0:,}'.format(rng.randint(1, 2000 if area.isupper() else 300)))
+        # The real files have a few empty columns tacked onto the end of every row
+        lines.append('\t'.join(cells + ['', '']))
+
+    lines.extend(['',
+                  '-: No reported cases.',
+                  'N: Not notifiable.',
+                  'U: Unavailable.',
+                  '* Incidence data for reporting years are provisional.',
+                  '', ''])
+    return '\r\n'.join(lines)
+
+
+class FakeMMWRServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Threaded HTTP server that answers like wonder.cdc.gov/mmwr/. Start it with start(), point CrawlTables at
+    .base_url, and stop() it when done.
+
+    Like a real server it keeps connections alive, and sends ETag headers and honours If-None-Match, so connection
+    pooling and response caching can be exercised too. Counts of requests served are kept in .requests_served.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+    # Room for a burst of connections from a many-worker crawl; the default backlog of 5 causes connect timeouts
+    request_queue_size = 128
+
+    def __init__(self, port=0, corpus_dir=None, latency=0.0, latency_jitter=0.0, error_rate=0.0,
+                 long_years=LONG_YEARS, tables=DEFAULT_TABLES, seed=None):
+        """
+        :param port: Port to listen on (0 picks any free port)
+        :param corpus_dir: Folder of {year}_wk{week}_table{t}.tab files to serve. If not given, tab files are made up.
+        :param latency: Seconds to wait before answering each request...
+        :param latency_jitter: ...plus up to this many more, picked at random
+        :param error_rate: Fraction of requests to answer with an HTTP 500
+        :param long_years: Years that have a week 53. Requests for weeks beyond the end of the year get a page with
+            no list of tables, like the real site.
+        :param tables: Tables published each week (ignored when serving from a corpus folder)
+        :param seed: Seed for the latency and error dice, for repeatable runs
+        """
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', port), FakeMMWRRequestHandler)
+        self.corpus_dir = corpus_dir
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.long_years = frozenset(long_years)
+        self.tables = tables
+        self.random = random.Random(seed)
+        self.requests_served = 0
+        self._lock = threading.Lock()
+
+        self.corpus = {}
+        if corpus_dir:
+            for name in os.listdir(corpus_dir):
+                match = re.match(r'^(\d+)_wk(\d+)_table(\w+)\.tab$', name)
+                if match:
+                    year, week, table = int(match.group(1)), int(match.group(2)), match.group(3)
+                    self.corpus.setdefault((year, week), {})[table] = os.path.join(corpus_dir, name)
+
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return 'http://127.0.0.1:{0}/mmwr/'.format(self.server_port)
+
+    def start(self):
+        """
+        Serve requests from a background thread. Returns the base URL to hand to CrawlTables.
+        """
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+    def weeks_in_year(self, year):
+        return 53 if year in self.long_years else 52
+
+    def tables_for_week(self, year, week):
+        if not 1 <= week <= self.weeks_in_year(year):
+            return []
+        if self.corpus_dir:
+            return sorted(self.corpus.get((year, week), {}))
+        return list(self.tables)
+
+    def tabfile(self, year, week, tablename):
+        """
+        Contents of a tab file, or None if that table wasn't published that week
+        """
+        if tablename not in self.tables_for_week(year, week):
+            return None
+        if self.corpus_dir:
+            with open(self.corpus[(year, week)][tablename], 'rb') as f:
+                return f.read()
+        return synthesize_tabfile(year, week, tablename)
+
+
+class FakeMMWRRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; with Nagle's algorithm on, each keep-alive response would wait ~40ms
+    # for the client's delayed ACK, and the benchmarks would mostly be measuring that
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        # Thousands of requests per benchmark; don't spam the console
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server._lock:
+            server.requests_served += 1
+            delay = server.latency + server.random.uniform(0, server.latency_jitter)
+            fail = server.random.random() < server.error_rate
+        if delay:
+            time.sleep(delay)
+        if fail:
+            return self.reply(500, 'Internal server error')
+
+        url = urlparse.urlsplit(self.path)
+        params = dict(urlparse.parse_qsl(url.query))
+        try:
+            year, week = int(params['mmwr_year']), int(params['mmwr_week'])
+        except (KeyError, ValueError):
+            return self.reply(404, 'Not found')
+
+        if url.path.endswith('/mmwrmorb2.asp'):
+            tables = server.tables_for_week(year, week)
+            if tables:
+                options = ''.join('<option value="{0}">Table {0}</option>'.format(t) for t in tables)
+                body = '<html><body><form><select name="mmwr_table">{0}</select></form></body></html>'.format(options)
+            else:
+                body = '<html><body>No tables were published for the requested week.</body></html>'
+            return self.reply(200, body, 'text/html')
+
+        if url.path.endswith('/mmwr_reps.asp') and params.get('request') == 'Export':
+            body = server.tabfile(year, week, params.get('mmwr_table'))
+            if body is None:
+                return self.reply(404, 'Not found')
+            return self.reply(200, body, 'text/plain')
+
+        return self.reply(404, 'Not found')
+
+    def reply(self, status, body, content_type='text/plain'):
+        etag = '"{0}"'.format(hashlib.sha1(body).hexdigest())
+        if status == 200 and self.headers.getheader('If-None-Match') == etag:
+            status, body = 304, ''
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if status in (200, 304):
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve fake MMWR table pages for testing the crawler')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--corpus', help='folder of .tab files to serve (default: make them up)')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds of delay per request')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many extra seconds of random delay')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests that fail with HTTP 500')
+    args = parser.parse_args()
+
+    server = FakeMMWRServer(port=args.port, corpus_dir=args.corpus, latency=args.latency,
+                            latency_jitter=args.jitter, error_rate=args.error_rate)
+    print 'Serving fake MMWR pages at', server.base_url
+    server.serve_forever()
@@ -1,9 +1,30 @@
 
 __author__ = 'Andrew Boughton and the A2 Hack for Change team'
 
-import urllib2
+import Queue
+import collections
+import httplib
+import os
+import sys
+import threading
+import time
+import urlparse
 from BeautifulSoup import BeautifulSoup
 
+# The parsers folder has the MMWR calendar (mmwr_calendar.py) and the storage formats crawls can be written in:
+#  compressed files (compressed_files.py) and the packed archive (tab_archive.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'parsers'))
+from compressed_files import BundleWriter, COMPRESSORS, find_tabfile, write_tabfile
+from mmwr_calendar import week_range
+from tab_archive import TabArchiveWriter
+
+from crawl_manifest import CrawlManifest
+from http_session import HTTPSession
+from response_cache import CachedResponse
+
+# Network trouble (including HTTPError/URLError) and malformed responses from the server. Anything else is a bug.
+FETCH_ERRORS = (IOError, httplib.HTTPException)
+
 
 class CrawlTables(object):
     """Crawls morbidity table data from the Center for Disease Control's Morbidity table web service.
@@ -16,68 +37,325 @@ class CrawlTables(object):
     http://wonder.cdc.gov/aids-v2001.html
     """
 
-    def __init__(self, startyear=2006, endyear=2013, startweek=1, endweek=12):
+    def __init__(self, startyear=2006, endyear=2013, startweek=1, endweek=12, workers=1, max_per_host=4,
+                 output_dir='.', manifest=None, cache=None, session=None, scheduler=None,
+                 base_url='http://wonder.cdc.gov/mmwr/', archive=None, compression=None):
         """
         Set up and run the crawler whenever an instance of this MMWR crawler object is instantiated. See example at end
         of file for usage: time range (weeks and years) can be manually specified. There's no sanity checking and
         limited error handling, so try to pick values that make sense. :)
+
+        By default weeks are crawled one after another. Pass workers > 1 to fetch table lists and tab files for many
+        weeks at once with a pool of threads; no more than max_per_host requests are ever in flight to the same host,
+        however many workers there are. Each file is written as soon as it arrives. A request that fails is recorded
+        in .failures instead of stopping the crawl.
+
+        If a CrawlManifest is provided, every fetch is recorded in it and anything the manifest says is already
+        complete is skipped, so re-running the same crawl only retries what is missing or failed.
+
+        If a response cache is provided (see response_cache.py), pages already seen are revalidated with a conditional
+        GET instead of downloaded again, or not requested at all while they are younger than the cache's max_age.
+
+        All requests go through one HTTPSession, which keeps connections to the server open between requests. Pass
+        your own to change timeouts or turn off gzip. Throughput figures for the crawl are available from summary().
+
+        A RequestScheduler adds rate limiting that adapts to the server's latency and error rate, plus retries with
+        backoff for requests that fail. Without one, requests are made as fast as the workers can go, and never retried.
+
+        With an archive (see parsers/tab_archive.py), tab files are appended to one packed archive file instead of being
+        written into output_dir one by one.
+
+        Tab files can also be compressed as they're written (see parsers/compressed_files.py): one .gz or .bz2 file
+        each, or 'zip' for one bundle per year. The parsers read all of these without being told which was used.
+        :param workers: Number of worker threads. 1 (the default) crawls serially.
+        :param max_per_host: Cap on simultaneous requests to any one host.
+        :param output_dir: Folder to write .tab files into.
+        :param manifest: A CrawlManifest (or the filename of one) to resume from and record progress in.
+        :param cache: A MemoryResponseCache, DiskResponseCache, or anything else with the same methods.
+        :param session: The HTTPSession to make requests with. Defaults to one pooling max_per_host connections.
+        :param scheduler: A RequestScheduler to pace and retry requests.
+        :param base_url: Where the MMWR pages live. Point it at a FakeMMWRServer to test or benchmark the crawler.
+        :param archive: A TabArchiveWriter (or the filename of an archive) to write tab files into.
+        :param compression: None (plain .tab files), 'gz', 'bz2' or 'zip'.
         """
         self.urls = []
+        self.failures = []
+        self.base_url = base_url
+        self.stats = collections.Counter()
+        self._stats_lock = threading.Lock()
+        self.cache = cache
+        self.session = session if session is not None else HTTPSession(pool_size=max_per_host)
+        self.scheduler = scheduler
+
+        self.output_dir = output_dir
+        if isinstance(manifest, basestring):
+            manifest = CrawlManifest(manifest)
+        self.manifest = manifest
+        if isinstance(archive, basestring):
+            archive = TabArchiveWriter(archive)
+        self.archive = archive
+        if compression is not None and compression != 'zip' and compression not in COMPRESSORS:
+            raise ValueError('Unknown compression: {0}'.format(compression))
+        self.compression = compression
+        self._bundles = BundleWriter(output_dir) if compression == 'zip' else None
+
+        self.max_per_host = max_per_host
+        self._host_slots = {}
+        self._host_slots_lock = threading.Lock()
+
+        self.started = time.time()
+        weeks = self.get_weeks(startyear, endyear, startweek, endweek)
+        if workers > 1:
+            self.crawl_concurrent(weeks, workers)
+        else:
+            for year, w in weeks:
+                self.crawl_week(year, w)
+        self.finished = time.time()
+
+    def get_weeks(self, startyear, endyear, startweek, endweek):
+        """
+        List the (year, week) pairs to crawl, in order. Weeks come from the MMWR calendar (see parsers/mmwr_calendar.py),
+        so week 53 is crawled in exactly the years that have one.
+        :rtype : list
+        """
+        return [(year, w) for year, w, week_ending in week_range(startyear, endyear, startweek, endweek)]
+
+    def crawl_week(self, year, week):
+        """
+        Fetch and save every table published in a given week
+        """
+        # If for some reason there are no tables returned- say if we request data for a week with none-
+        # don't do anything. Otherwise, fetch URL of page and save it.
+        for t in self.tables_to_fetch(year, week):
+            self.save_tabfile(year, week, t)
+
+    def tables_to_fetch(self, year, week):
+        """
+        List the tables in a given week that still need to be fetched. Without a manifest, that's all of them. With a
+        manifest, tables already fetched are left out, and the table list itself isn't re-downloaded if the manifest
+        already knows it.
+        :rtype : list
+        """
+        tables = self.manifest.week_tables(year, week) if self.manifest else None
+        if tables is None:
+            try:
+                tables = self.get_allowed_tables(year, week)
+            except FETCH_ERRORS as e:
+                self.failures.append((year, week, e))
+                return []
+            if not tables:
+                # Nothing published (yet). Don't record it, so that a later run looks again.
+                return []
+            if self.manifest:
+                self.manifest.record_week(year, week, tables)
+
+        if self.manifest:
+            tables = [t for t in tables if not self.is_saved(year, week, t)]
+        return tables
+
+    def is_saved(self, year, week, tablename):
+        """
+        Check (with the manifest) whether a table has already been fetched and is still where this crawl would save it
+        :rtype : bool
+        """
+        if self.archive:
+            return self.manifest.is_complete(year, week, tablename) and (year, week, tablename) in self.archive
+        if self.compression:
+            # Compressed copies aren't the size the manifest recorded, so just check there is one
+            fname = self.get_filename(year, week, tablename)
+            try:
+                find_tabfile(os.path.basename(fname), self.output_dir)
+            except IOError:
+                return False
+            return self.manifest.is_complete(year, week, tablename)
+        return self.manifest.is_complete(year, week, tablename, self.get_filename(year, week, tablename))
+
+    def get_filename(self, year, week, tablename):
+        """
+        Where to save the tab file for a given year, week and table
+        """
+        return os.path.join(self.output_dir, "{0}_wk{1:02}_table{2}.tab".format(year, week, tablename))
+
+    def save_tabfile(self, year, week, tablename):
+        """
+        Fetch one tab file and write it to disk (compressed, if asked) or add it to the archive. Failures are recorded
+        (in .failures and the manifest, if any), not raised.
+        """
+        try:
+            contents = self.get_tabfile(year, week, tablename)
+        except FETCH_ERRORS as e:
+            self.failures.append((year, week, tablename, e))
+            if self.manifest:
+                self.manifest.record_table(year, week, tablename, error=e)
+            return
+        self.store_tabfile(year, week, tablename, contents)
 
-        years = xrange(startyear, endyear + 1, 1)
-
-        for year in years:
-            # Figure out what the list of weeks in that year is (based on how many years we're crawling)
-            if year != endyear:
-                # Manually checked all years from 2006-2013 and found that only 2008 had 53 weeks
-                lastweek = (52 if year != 2008 else 53)
-                if year == startyear:
-                    weeks = xrange(startweek, lastweek + 1)
-                else:
-                    weeks = xrange(1, lastweek + 1)
-            else:
-                if startyear == endyear:
-                    weeks = xrange(startweek, endweek + 1)
-                else:
-                    weeks = xrange(1, endweek + 1)
-            for w in weeks:
-                tables = self.get_allowed_tables(year, w)
-                if tables:
-                    # If for some reason there are no tables returned- say if we request data for a week with none-
-                    # don't do anything. Otherwise, fetch URL of page and save it.
-                    # Default is to save to the same folder as this script; I moved them later via command line.
-                    #  Messy, but efficient.
-                    for t in tables:
-                        fname = "{0}_wk{1:02}_table{2}.tab".format(year, w, t)
-                        with open(fname, 'w') as f:
-                            f.write(self.get_tabfile(year, w, t))
+    def store_tabfile(self, year, week, tablename, contents):
+        """
+        Write the contents of a fetched tab file wherever this crawl keeps them, and record it in the manifest. Can be
+        replaced in a subclass to do something else with each file as it arrives (see pipeline.py).
+        """
+        fname = self.get_filename(year, week, tablename)
+        if self.archive:
+            self.archive.add(year, week, tablename, contents)
+        elif self._bundles:
+            self._bundles.add(os.path.basename(fname), contents)
+        else:
+            # Written to a temporary name first, so an interrupted crawl never leaves a truncated .tab file behind
+            write_tabfile(fname, contents, self.compression)
+        self.count('files_written')
+        self.count('bytes_written', len(contents))
+        if self.manifest:
+            self.manifest.record_table(year, week, tablename, contents=contents)
+
+    def crawl_concurrent(self, weeks, workers):
+        """
+        Crawl a list of (year, week) pairs using a pool of worker threads that share one task queue. Each week task
+        looks up the list of tables for that week, then queues one task per table, so tab files for many weeks can be
+        fetched at the same time. Returns once every queued task has finished.
+
+        An unexpected error in a worker (anything but a failed fetch, e.g. a full disk) stops the crawl: the remaining
+        tasks are drained without being run, and the first such error is raised here, as it would be in a serial crawl.
+        """
+        tasks = Queue.Queue()
+        errors = []
+
+        def work():
+            while True:
+                task = tasks.get()
+                if task is None:
+                    tasks.task_done()
+                    return
+                try:
+                    if errors:
+                        continue
+                    if len(task) == 2:
+                        for t in self.tables_to_fetch(*task):
+                            tasks.put(task + (t,))
+                    else:
+                        self.save_tabfile(*task)
+                except Exception:
+                    errors.append(sys.exc_info())
+                finally:
+                    tasks.task_done()
+
+        threads = [threading.Thread(target=work) for i in xrange(workers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        for year_and_week in weeks:
+            tasks.put(year_and_week)
+        # Week tasks queue their table tasks before being marked done, so this waits for the tables too
+        tasks.join()
+
+        for thread in threads:
+            tasks.put(None)
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0][0], errors[0][1], errors[0][2]
+
+    def fetch(self, url):
+        """
+        Fetch a URL and return the body of the response as a string. Waits for a free request slot for that host first,
+        so that concurrent crawls don't hammer the CDC servers.
+
+        With a response cache, a fresh cached copy is returned without any request, and a stale one is revalidated
+        with a conditional GET (a 304 Not Modified costs no body at all).
+
+        With a scheduler, the request waits its turn under the rate limit and is retried if it fails.
+        """
+        cached = self.cache.get(url) if self.cache else None
+        if cached is not None and self.cache.is_fresh(cached):
+            self.count('cache_hits')
+            return cached.body
+
+        def request():
+            with self._host_slot(url):
+                return self.session.get(url, headers=cached.conditional_headers() if cached else None)
+
+        if self.scheduler:
+            response = self.scheduler.call(url, request)
+        else:
+            response = request()
+
+        if response.status == 304 and cached is not None:
+            self.count('not_modified')
+            self.cache.refresh(url, cached)
+            return cached.body
+
+        if self.cache:
+            self.count('cache_misses')
+            self.cache.put(url, CachedResponse(response.body,
+                                               etag=response.getheader('ETag'),
+                                               last_modified=response.getheader('Last-Modified')))
+        return response.body
+
+    def count(self, name, amount=1):
+        """
+        Add to one of the crawl statistics in .stats (safe to call from any worker thread)
+        """
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    def summary(self):
+        """
+        Human-readable summary of what the crawl did and how fast it went
+        :rtype : str
+        """
+        elapsed = max(self.finished - self.started, 1e-6)
+        net = self.session.stats
+        latencies = sorted(self.session.latencies)
+        lines = ['Crawled in {0:.1f}s: {1} files ({2} bytes) written, {3} failures'.format(
+                     elapsed, self.stats['files_written'], self.stats['bytes_written'], len(self.failures)),
+                 '{0} requests ({1:.1f}/s), {2} bytes received ({3:.1f} KB/s), {4} bytes after decompression'.format(
+                     net['requests'], net['requests'] / elapsed, net['bytes_received'],
+                     net['bytes_received'] / elapsed / 1024, net['bytes_decoded']),
+                 '{0} connections opened, {1} reused'.format(net['connections_opened'], net['connections_reused'])]
+        if latencies:
+            lines.append('Request latency: median {0:.3f}s, 95th percentile {1:.3f}s, max {2:.3f}s'.format(
+                latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95)], latencies[-1]))
+        if self.cache:
+            lines.append('Cache: {0} hits, {1} not modified, {2} misses'.format(
+                self.stats['cache_hits'], self.stats['not_modified'], self.stats['cache_misses']))
+        if self.scheduler:
+            lines.append('Scheduler: {0} retries, {1} URLs dead-lettered, final rate {2:.2f} requests/s'.format(
+                self.scheduler.stats['retries'], len(self.scheduler.dead_letters), self.scheduler.rate))
+        return '\n'.join(lines)
+
+    def _host_slot(self, url):
+        host = urlparse.urlparse(url).netloc
+        with self._host_slots_lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._host_slots[host]
 
     def get_tabfile(self, year, week, tablename):
         """
         Fetches the contents (and returns a string) of a specific MWR tab-delimited file, using
          the manually specified URL pattern from the CDC site and the specified year/month/tablename.
          There's basically no error handling in the event of server issues (which will yield an HTTPError).
-         Just try again later- the bulk downloader shouldn't need to be run often anyway.
+         Just try again later- with a manifest, a re-run only fetches what failed.
         """
         # Can be used to get HTML files instead by replacing request=Export with request=Submit.
 
-        file_url = 'http://wonder.cdc.gov/mmwr/mmwr_reps.asp?mmwr_year={0}&mmwr_week={1:02}&mmwr_table={2}&request=Export'.format(
+        file_url = self.base_url + 'mmwr_reps.asp?mmwr_year={0}&mmwr_week={1:02}&mmwr_table={2}&request=Export'.format(
             year, week, tablename)
         self.urls.append(file_url)
 
-        datafile = urllib2.urlopen(file_url)
-        return datafile.read()
+        return self.fetch(file_url)
 
     def get_allowed_tables(self, year, week):
         """
         The list of tables published may vary from week to week. This fetches the list from the CDC mmwr pages so
         that none are missed.
         """
-        table_list_page = urllib2.urlopen(
-            'http://wonder.cdc.gov/mmwr/mmwrmorb2.asp?mmwr_year={0}&mmwr_week={1:02}'.format(
+        table_list_page = self.fetch(
+            self.base_url + 'mmwrmorb2.asp?mmwr_year={0}&mmwr_week={1:02}'.format(
                 year, week))
 
-        soup = BeautifulSoup(table_list_page.read())
+        soup = BeautifulSoup(table_list_page)
 
         try:
             mmwr_table_tags = soup.find('select', {'name': 'mmwr_table'}).findAll('option')
@@ -96,5 +374,36 @@ if __name__ == '__main__':
     # skipped 2007 wk 13 because one of the tables that week generated errors. Seemingly on web site too?
     crawled = CrawlTables(startyear=1996, endyear=2005, startweek=1, endweek=52)
 
+    # With a manifest, failures like 2007 wk 13 no longer mean starting over: re-running the same command retries only
+    # what is missing or failed. Handy for a weekly cron job, too.
+    #crawled = CrawlTables(startyear=1996, endyear=2013, startweek=1, endweek=52,
+    #                      output_dir='../tabdatafiles', manifest='../tabdatafiles/crawl_manifest.jsonl')
+
+    # Re-crawling recent weeks to pick up provisional revisions: keep responses around, and only re-download a page
+    # if the server says it changed.
+    #from response_cache import DiskResponseCache
+    #crawled = CrawlTables(startyear=2013, endyear=2013, startweek=1, endweek=21,
+    #                      cache=DiskResponseCache('../http_cache', max_bytes=256 * 1024 * 1024))
+
+    # Let a scheduler work out how hard the server can be pushed, and retry the occasional 500 or hang
+    #from request_scheduler import RequestScheduler
+    #crawled = CrawlTables(startyear=1996, endyear=2013, startweek=1, endweek=52, workers=8,
+    #                      scheduler=RequestScheduler(rate=4, max_rate=20))
+    #print crawled.scheduler.dead_letters
+
+    # Write the whole history into one packed archive instead of ~8k separate files (see parsers/tab_archive.py)
+    #crawled = CrawlTables(startyear=1996, endyear=2013, startweek=1, endweek=52, workers=8,
+    #                      manifest='../crawl_manifest.jsonl', archive='../mmwr.tabpack')
+
+    # Keep the raw files compressed- the text is so repetitive that gzip shrinks it several times over
+    #crawled = CrawlTables(startyear=1996, endyear=2013, startweek=1, endweek=52, output_dir='../tabdatafiles',
+    #                      compression='gz')
+
+    # Most of a long crawl is spent waiting on the network, so a backfill goes much faster with a few workers:
+    #crawled = CrawlTables(startyear=1996, endyear=2013, startweek=1, endweek=52, workers=8, max_per_host=4)
+    #print crawled.failures
+
+    print crawled.summary()
+
     # The line below can be uncommented to see/output list of all urls visited
     #print crawled.urls
\ No newline at end of file
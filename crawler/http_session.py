@@ -0,0 +1,158 @@
+__author__ = 'Andrew Boughton and the A2 Hack for Change team'
+
+import collections
+import gzip
+import httplib
+import socket
+import threading
+import time
+import urllib2
+import urlparse
+from cStringIO import StringIO
+
+
+class Response(object):
+    """
+    A fully read HTTP response
+    """
+
+    def __init__(self, url, status, reason, headers, body):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+
+class HTTPSession(object):
+    """
+    Makes GET requests over a pool of persistent (keep-alive) connections, shared by all the threads of a crawl.
+    urllib2.urlopen sets up a new TCP connection for every request, which for the tiny tab files served by
+    wonder.cdc.gov takes about as long as the download itself.
+
+    Connections are checked out of the pool for exactly one request at a time, and up to pool_size idle connections
+    per host are kept for reuse. Responses with a status of 400 or above raise urllib2.HTTPError, same as urlopen.
+
+    Throughput figures are kept in .stats: number of requests, bytes received, connections opened, and the time taken
+    by each request (.latencies, in seconds).
+    """
+
+    max_redirects = 5
+
+    def __init__(self, pool_size=4, timeout=30, accept_gzip=True):
+        """
+        :param pool_size: Maximum number of idle connections to keep open per host
+        :param timeout: Seconds to wait when connecting or reading before giving up (raises socket.timeout)
+        :param accept_gzip: Ask the server to gzip responses. Bodies are always returned uncompressed.
+        """
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.accept_gzip = accept_gzip
+
+        self.stats = collections.Counter()
+        self.latencies = []
+
+        self._idle = collections.defaultdict(list)
+        self._lock = threading.Lock()
+
+    def get(self, url, headers=None):
+        """
+        GET a URL (following redirects) and return a Response with the whole body read
+        :rtype : Response
+        """
+        for i in xrange(self.max_redirects + 1):
+            response = self._get_once(url, headers or {})
+            if response.status in (301, 302, 303, 307, 308) and response.getheader('location'):
+                url = urlparse.urljoin(url, response.getheader('location'))
+                continue
+            break
+
+        if response.status >= 400:
+            raise urllib2.HTTPError(url, response.status, response.reason, response.headers, None)
+        return response
+
+    def _get_once(self, url, headers):
+        parts = urlparse.urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        request_headers = {'Connection': 'keep-alive'}
+        if self.accept_gzip:
+            request_headers['Accept-Encoding'] = 'gzip'
+        request_headers.update(headers)
+
+        started = time.time()
+        conn, reused = self._checkout(key)
+        try:
+            conn.request('GET', path, headers=request_headers)
+            raw = conn.getresponse()
+            body = raw.read()
+        except (httplib.HTTPException, socket.error):
+            conn.close()
+            if not reused:
+                raise
+            # The server quietly closed an idle keep-alive connection. Try once more on a fresh one.
+            conn, reused = self._checkout(key, fresh=True)
+            try:
+                conn.request('GET', path, headers=request_headers)
+                raw = conn.getresponse()
+                body = raw.read()
+            except (httplib.HTTPException, socket.error):
+                conn.close()
+                raise
+
+        if raw.will_close:
+            conn.close()
+        else:
+            self._checkin(key, conn)
+
+        response_headers = dict((k.lower(), v) for k, v in raw.getheaders())
+        wire_bytes = len(body)
+        if response_headers.get('content-encoding') == 'gzip':
+            body = gzip.GzipFile(fileobj=StringIO(body)).read()
+
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['bytes_received'] += wire_bytes
+            self.stats['bytes_decoded'] += len(body)
+            self.latencies.append(time.time() - started)
+
+        return Response(url, raw.status, raw.reason, response_headers, body)
+
+    def _checkout(self, key, fresh=False):
+        """
+        Take an idle connection to a host out of the pool (or open a new one). Returns (connection, was it reused)
+        """
+        if not fresh:
+            with self._lock:
+                if self._idle[key]:
+                    self.stats['connections_reused'] += 1
+                    return self._idle[key].pop(), True
+
+        scheme, netloc = key
+        connection_class = httplib.HTTPSConnection if scheme == 'https' else httplib.HTTPConnection
+        with self._lock:
+            self.stats['connections_opened'] += 1
+        return connection_class(netloc, timeout=self.timeout), False
+
+    def _checkin(self, key, conn):
+        with self._lock:
+            if len(self._idle[key]) < self.pool_size:
+                self._idle[key].append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        """
+        Close every idle connection in the pool
+        """
+        with self._lock:
+            for connections in self._idle.itervalues():
+                for conn in connections:
+                    conn.close()
+            self._idle.clear()
@@ -0,0 +1,193 @@
+#! /usr/bin/env python
+__author__ = 'Andrew Boughton and the A2 Hack for Change team'
+# Crawl, parse and store in one pass. Instead of crawling into a folder, moving the files by hand and then parsing them
+# with a separate script, every tab file goes straight from the fetch threads to a pool of parser processes, and each
+# parsed file straight on to a single writer (a SQLite database, say):
+#
+#   fetch threads --(tab file text)--> parser processes --(parsed files)--> writer thread
+#
+# No more than max_pending fetched files are ever waiting to be parsed or written. Once that many are queued up, the
+# fetch threads wait for the writer to catch up, so memory use stays flat however long the crawl is and however slow
+# the writer is. Raw files are only written to disk if asked for (keep_raw=True, plus any of CrawlTables' storage
+# options: output_dir, compression, archive).
+#
+#   python pipeline.py --startyear 2013 --endyear 2013 --startweek 1 --endweek 21 --database ../mmwr.sqlite
+
+import argparse
+import multiprocessing
+import os
+import Queue
+import sys
+import threading
+import time
+import traceback
+
+from fetch_cdc_tables import CrawlTables
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'parsers'))
+from parse_table2_tabfiles import ColumnarTabFileParser
+from sqlite_store import connect, ingest_parsed
+from tab_archive import tab_filename
+
+
+class RawTabFile(object):
+    """
+    Text of one fetched tab file, standing in for the folder a TabFileParser would otherwise read it from:
+        ColumnarTabFileParser('2013_wk09_table2H.tab', filepath=RawTabFile(contents))
+    """
+
+    def __init__(self, contents):
+        self.contents = contents
+
+    def readlines(self, filename):
+        return self.contents.splitlines()
+
+
+def _parse_raw(job):
+    """
+    Parse one fetched file inside a parser process. Returns (filename, parsed object or None, error text or None)
+    """
+    filename, contents, parser_class = job
+    try:
+        return filename, parser_class(filename, filepath=RawTabFile(contents)), None
+    except Exception:
+        return filename, None, traceback.format_exc()
+
+
+class SQLiteWriter(object):
+    def __init__(self, database, search_index=None):
+        """
+        Writer for a PipelineCrawl that loads parsed files into a SQLite database (see parsers/sqlite_store.py). The
+        connection is opened by the writer thread itself, the first time it's called.
+        :param search_index: A FilenameIndex to add the files to as well (see parsers/search_index.py)
+        """
+        self.database = database
+        self.search_index = search_index
+        self.conn = None
+        self.written = 0
+
+    def __call__(self, parsed_data):
+        if self.conn is None:
+            self.conn = connect(self.database)
+        self.written += ingest_parsed(self.conn, parsed_data, search_index=self.search_index)
+
+
+class PipelineCrawl(CrawlTables):
+    def __init__(self, startyear=2006, endyear=2013, startweek=1, endweek=12, writer=None, parse_processes=None,
+                 max_pending=64, batch_size=50, keep_raw=False, parser_class=ColumnarTabFileParser, **crawl_options):
+        """
+        Crawl a range of weeks, parsing and storing each tab file as it arrives. Like CrawlTables, everything happens
+        when the object is created; it returns once every file has been written.
+        :param writer: Called (from a single thread) with lists of parsed objects, in the order they finish parsing.
+            Defaults to keeping them in .parsed.
+        :param parse_processes: Number of parser processes (defaults to the number of cores)
+        :param max_pending: Most fetched files allowed to be waiting to be parsed or written at once
+        :param batch_size: Most parsed files handed to the writer at once
+        :param keep_raw: Also store the raw tab files, as CrawlTables would (see output_dir, compression and archive)
+        :param parser_class: TabFileParser subclass to parse with
+        :param crawl_options: Anything else CrawlTables takes: workers, manifest, scheduler, base_url...
+            Without keep_raw, a manifest can't tell that a table was fetched (there's no file to check), so a re-run
+            fetches everything again.
+        """
+        self.parsed = []
+        self.parse_failures = []
+        self.writer = writer if writer is not None else self.parsed.extend
+        self.keep_raw = keep_raw
+        self.parser_class = parser_class
+        self.batch_size = batch_size
+        self.write_error = None
+
+        self._pending = threading.BoundedSemaphore(max_pending)
+        self._results = Queue.Queue()
+        # The pool has to be started before any threads are, since it forks
+        self._pool = multiprocessing.Pool(parse_processes)
+        writer_thread = threading.Thread(target=self._write_results)
+        writer_thread.daemon = True
+        writer_thread.start()
+
+        try:
+            super(PipelineCrawl, self).__init__(startyear, endyear, startweek, endweek, **crawl_options)
+        finally:
+            # Wait for the files still being parsed, then for the writer to finish with them
+            self._pool.close()
+            self._pool.join()
+            self._results.put(None)
+            writer_thread.join()
+        self.finished = time.time()
+        if self.write_error is not None:
+            raise self.write_error
+
+    def store_tabfile(self, year, week, tablename, contents):
+        """
+        Hand a fetched file on to the parser processes (and store it raw as well, if asked). Waits while max_pending
+        files are already queued up.
+        """
+        if self.keep_raw:
+            super(PipelineCrawl, self).store_tabfile(year, week, tablename, contents)
+        self._pending.acquire()
+        self._pool.apply_async(_parse_raw, ((tab_filename((year, week, tablename)), contents, self.parser_class),),
+                               callback=self._results.put)
+
+    def _write_results(self):
+        """
+        Writer thread: hand parsed files to the writer in batches, as they come back from the parser processes
+        """
+        done = False
+        while not done:
+            results = [self._results.get()]
+            while len(results) < self.batch_size:
+                try:
+                    results.append(self._results.get_nowait())
+                except Queue.Empty:
+                    break
+            if results[-1] is None:
+                results.pop()
+                done = True
+
+            batch = []
+            for filename, parsed, error in results:
+                if error is None:
+                    batch.append(parsed)
+                else:
+                    self.parse_failures.append((filename, error))
+            try:
+                if batch and self.write_error is None:
+                    self.writer(batch)
+                    self.count('files_parsed', len(batch))
+            except Exception as e:
+                # Stop writing, but keep draining the queue so the fetch threads don't wait forever
+                self.write_error = e
+            finally:
+                for result in results:
+                    self._pending.release()
+
+    def summary(self):
+        lines = [super(PipelineCrawl, self).summary(),
+                 '{0} files parsed and written, {1} could not be parsed'.format(
+                     self.stats['files_parsed'], len(self.parse_failures))]
+        return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Crawl MMWR tables straight into a SQLite database')
+    parser.add_argument('--startyear', type=int, required=True)
+    parser.add_argument('--endyear', type=int, required=True)
+    parser.add_argument('--startweek', type=int, default=1)
+    parser.add_argument('--endweek', type=int, default=52)
+    parser.add_argument('--database', default='../mmwr.sqlite', help='SQLite database to load into')
+    parser.add_argument('--workers', type=int, default=4, help='fetch threads')
+    parser.add_argument('--processes', type=int, default=None, help='parser processes (default: one per core)')
+    parser.add_argument('--max-pending', type=int, default=64, help='most fetched files waiting to be parsed/written')
+    parser.add_argument('--keep-raw', help='also save the raw tab files in this folder')
+    parser.add_argument('--base-url', default='http://wonder.cdc.gov/mmwr/', help='where the MMWR pages live')
+    args = parser.parse_args()
+
+    writer = SQLiteWriter(args.database)
+    crawled = PipelineCrawl(startyear=args.startyear, endyear=args.endyear, startweek=args.startweek,
+                            endweek=args.endweek, writer=writer, parse_processes=args.processes,
+                            max_pending=args.max_pending, keep_raw=bool(args.keep_raw),
+                            output_dir=args.keep_raw or '.', workers=args.workers, base_url=args.base_url)
+    print crawled.summary()
+    print 'Loaded {0} observations into {1}'.format(writer.written, args.database)
+    for filename, error in crawled.parse_failures:
+        print 'Could not parse', filename
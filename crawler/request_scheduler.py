@@ -0,0 +1,179 @@
+__author__ = 'Andrew Boughton and the A2 Hack for Change team'
+
+import collections
+import httplib
+import random
+import socket
+import threading
+import time
+import urllib2
+
+
+class TokenBucket(object):
+    """
+    Classic token bucket: tokens drip in at `rate` per second, up to `burst` of them, and every request spends one.
+    Callers that find the bucket empty wait for the next token.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = self.burst
+        self._last = time.time()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._refill()
+            self.rate = float(rate)
+
+    def _refill(self):
+        now = time.time()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self):
+        """
+        Take a token, sleeping until one is available
+        """
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class RequestScheduler(object):
+    """
+    Paces and retries requests for the crawler, so that a parallel crawl goes as fast as wonder.cdc.gov allows without
+    tipping it over (the server is known to throw HTTP 500s and hang- see notes_misc.txt re: 2007 wk 13).
+
+    - Requests are rate limited by a token bucket, shared by every thread using the scheduler.
+    - Failures that might be temporary (5xx, 429, timeouts, dropped connections) are retried after an exponential
+      backoff with full jitter, up to max_retries times per URL. A Retry-After header from the server is respected.
+    - URLs that use up their retries, or fail in a way that won't get better (like a 404), go on the dead letter list
+      (.dead_letters, URL -> last error) and are not requested again by this scheduler.
+    - The request rate adapts to how the server is coping, like TCP's congestion control. After every `window`
+      requests, the rate is halved if the error rate or median latency over that window was too high. Otherwise it
+      goes up: doubling each window ("slow start") until the first time it has to be halved, so a healthy server is
+      found out within a few windows, and from then on growing by increase_fraction of itself per window.
+    """
+
+    def __init__(self, rate=4.0, min_rate=0.25, max_rate=40.0, burst=4, max_retries=4, backoff_base=1.0,
+                 backoff_cap=60.0, target_latency=2.0, max_error_rate=0.05, window=20, increase_fraction=0.1):
+        """
+        :param rate: Starting request rate, in requests per second
+        :param min_rate: The rate never drops below this...
+        :param max_rate: ...or rises above this
+        :param burst: How many requests may be made back-to-back before pacing kicks in
+        :param max_retries: Retry budget for each URL
+        :param backoff_base: Seconds to back off after the first failure; doubles with every further failure
+        :param backoff_cap: Longest backoff, in seconds
+        :param target_latency: Slow down if the median request takes longer than this many seconds
+        :param max_error_rate: Slow down if more than this fraction of requests fail
+        :param window: Number of requests between rate adjustments
+        :param increase_fraction: After the first slow-down, how much faster to go after each healthy window, as a
+            fraction of the current rate (but always at least 1 request per second)
+        """
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.target_latency = target_latency
+        self.max_error_rate = max_error_rate
+        self.window = window
+        self.increase_fraction = increase_fraction
+        # Doubling stops for good once the rate reaches this. Starts at max_rate, and drops when the server struggles.
+        self.slow_start_limit = max_rate
+
+        self.bucket = TokenBucket(rate, burst)
+        self.dead_letters = {}
+        self.stats = collections.Counter()
+
+        self._recent = []
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    def call(self, url, request_func):
+        """
+        Call request_func() (which should fetch url and return the result) under the scheduler's rate limit and retry
+        policy. Returns whatever request_func returns, or raises its last exception once the URL is given up on.
+        """
+        if url in self.dead_letters:
+            raise self.dead_letters[url]
+
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            started = time.time()
+            try:
+                result = request_func()
+            except (IOError, httplib.HTTPException) as e:
+                self._observe(time.time() - started, failed=True)
+                if not self.is_retryable(e) or attempt >= self.max_retries:
+                    with self._lock:
+                        self.dead_letters[url] = e
+                        self.stats['dead_lettered'] += 1
+                    raise
+                with self._lock:
+                    self.stats['retries'] += 1
+                time.sleep(self.backoff(attempt, e))
+                attempt += 1
+                continue
+
+            self._observe(time.time() - started, failed=False)
+            return result
+
+    def is_retryable(self, error):
+        """
+        Whether a failed request is worth trying again
+        :rtype : bool
+        """
+        if isinstance(error, urllib2.HTTPError):
+            return error.code >= 500 or error.code in (408, 429)
+        # Timeouts, refused/reset connections, and garbled responses
+        return isinstance(error, (urllib2.URLError, socket.error, httplib.HTTPException))
+
+    def backoff(self, attempt, error=None):
+        """
+        Seconds to wait before retry number attempt+1: exponential backoff with full jitter, unless the server said
+        (via Retry-After) how long to wait.
+        """
+        headers = getattr(error, 'hdrs', None)
+        retry_after = headers.get('retry-after') if headers else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.backoff_cap)
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def _observe(self, latency, failed):
+        with self._lock:
+            self.stats['requests'] += 1
+            if failed:
+                self.stats['errors'] += 1
+            self._recent.append((latency, failed))
+            if len(self._recent) < self.window:
+                return
+            recent, self._recent = self._recent, []
+
+        error_rate = sum(1 for latency, failed in recent if failed) / float(len(recent))
+        median_latency = sorted(latency for latency, failed in recent)[len(recent) // 2]
+        with self._lock:
+            rate = self.rate
+            if error_rate > self.max_error_rate or median_latency > self.target_latency:
+                # Multiplicative decrease: back off hard as soon as the server shows signs of strain
+                rate = max(self.min_rate, rate / 2)
+                self.slow_start_limit = rate
+            elif rate < self.slow_start_limit:
+                # Slow start: nothing has gone wrong yet, so find the server's limit quickly
+                rate = min(self.slow_start_limit, rate * 2)
+            else:
+                # Past the point where it last struggled: creep up, in proportion to how fast we're already going
+                rate += max(1.0, rate * self.increase_fraction)
+            self.bucket.set_rate(min(self.max_rate, rate))
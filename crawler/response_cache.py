@@ -0,0 +1,163 @@
+__author__ = 'Andrew Boughton and the A2 Hack for Change team'
+
+import cPickle
+import collections
+import hashlib
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'parsers'))
+from persistence import atomic_file
+
+
+class CachedResponse(object):
+    """
+    The body of a response plus the validators needed to ask the server whether it has changed since
+    """
+
+    def __init__(self, body, etag=None, last_modified=None, stored=None):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored = time.time() if stored is None else stored
+
+    def conditional_headers(self):
+        """
+        Headers that turn a GET for this URL into a conditional GET
+        :rtype : dict
+        """
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class MemoryResponseCache(object):
+    """
+    Keeps responses in memory, evicting the least recently used ones once the bodies add up to more than max_bytes.
+
+    Any object with the same get/put/refresh methods can be handed to CrawlTables instead (see DiskResponseCache for
+    one that survives between runs).
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_age=None):
+        """
+        :param max_bytes: Size cap for all cached bodies put together
+        :param max_age: Responses younger than this many seconds are used without asking the server at all. Older
+            ones (or all of them, if None) are revalidated with a conditional GET.
+        """
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.stats = collections.Counter()
+
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def is_fresh(self, entry):
+        """
+        Whether an entry is young enough to be used without revalidation
+        :rtype : bool
+        """
+        return self.max_age is not None and time.time() - entry.stored < self.max_age
+
+    def get(self, url):
+        """
+        Return the CachedResponse for a URL, or None
+        """
+        with self._lock:
+            entry = self._entries.pop(url, None)
+            if entry is not None:
+                # Re-insert to mark as most recently used
+                self._entries[url] = entry
+            return entry
+
+    def put(self, url, entry):
+        with self._lock:
+            old = self._entries.pop(url, None)
+            if old is not None:
+                self._size -= len(old.body)
+            if len(entry.body) > self.max_bytes:
+                return
+            self._entries[url] = entry
+            self._size += len(entry.body)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.body)
+                self.stats['evicted'] += 1
+
+    def refresh(self, url, entry):
+        """
+        The server confirmed (304 Not Modified) that a cached response is still current- restart its clock
+        """
+        entry.stored = time.time()
+        self.put(url, entry)
+
+
+class DiskResponseCache(MemoryResponseCache):
+    """
+    Response cache kept in a folder on disk (one pickled file per URL), so that it survives between crawls. File
+    modification times track how recently each entry was used, and the least recently used files are deleted once the
+    folder grows past max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024, max_age=None):
+        super(DiskResponseCache, self).__init__(max_bytes=max_bytes, max_age=max_age)
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # Rebuild LRU order (by file modification time) from whatever earlier runs left behind
+        existing = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.resp')]
+        existing.sort(key=os.path.getmtime)
+        for path in existing:
+            size = os.path.getsize(path)
+            self._entries[path] = size
+            self._size += size
+        self._evict()
+
+    def _path(self, url):
+        return os.path.join(self.directory, hashlib.sha1(url).hexdigest() + '.resp')
+
+    def get(self, url):
+        path = self._path(url)
+        with self._lock:
+            if path not in self._entries:
+                return None
+            self._entries[path] = self._entries.pop(path)
+        try:
+            with open(path, 'rb') as f:
+                entry = cPickle.load(f)
+            os.utime(path, None)
+        except (IOError, OSError, EOFError, cPickle.UnpicklingError):
+            # Deleted or half-written by someone else. Treat as a miss.
+            return None
+        return entry
+
+    def put(self, url, entry):
+        path = self._path(url)
+        data = cPickle.dumps(entry, cPickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+        with atomic_file(path) as f:
+            f.write(data)
+
+        with self._lock:
+            self._size -= self._entries.pop(path, 0)
+            self._entries[path] = len(data)
+            self._size += len(data)
+            self._evict()
+
+    def _evict(self):
+        while self._size > self.max_bytes:
+            evicted, size = self._entries.popitem(last=False)
+            self._size -= size
+            self.stats['evicted'] += 1
+            try:
+                os.remove(evicted)
+            except OSError:
+                pass
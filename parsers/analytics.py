@@ -0,0 +1,250 @@
+__author__ = 'Andrew Boughton and the A2 Hack for Change team'
+# Rolling baselines and anomaly scores for every disease in every reporting area at once, using numpy.
+#
+# WeeklySeries.from_parsed() lays a parsed archive out as one big matrix: a row per (disease, reporting area) series, a
+# column per MMWR week from the first week in the archive to the last (weeks that are missing from the archive are left
+# empty, so "the previous 52 weeks" always means 52 calendar weeks). Cells that don't hold a number (N, U, not
+# published...) are NaN. Everything else is computed on the whole matrix:
+#   counts = WeeklySeries.from_parsed(parsed_data)
+#   baseline = rolling_baseline(counts.values)            # median, maximum, mean and std of the previous 52 weeks
+#   z = z_scores(counts.values, baseline)                  # how unusual each week is, compared to its baseline
+#   changes = week_over_week(counts.values)
+# and the baseline can be checked against the "previous 52 weeks median/maximum" columns the CDC publishes:
+#   published = WeeklySeries.from_parsed(parsed_data, statistic='median')
+#   compare_with_published(baseline['median'], counts, published)
+# Weekly counts can also be rebuilt from the year-to-date columns, for weeks or diseases without a current week column:
+#   weekly, revised = weekly_from_cumulative(WeeklySeries.from_parsed(parsed_data, statistic='cumulative'))
+#   dense = fill_missing(counts, weekly)
+
+import warnings
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+from column_names import normalize_column_name, series_name
+from columnar_table import COUNT, NO_CASES, row_geography, row_names, typed_column
+from geography import UNMAPPED, areas
+from mmwr_calendar import week_range
+
+
+class WeeklySeries(object):
+    def __init__(self, weeks, dates, keys, values):
+        """
+        :param weeks: (MMWR year, MMWR week) of each column of values
+        :param dates: Week ending date of each column
+        :param keys: (disease, geography ID) of each row of values. Rows that aren't known reporting areas are keyed
+            by their label instead of an ID, so each stays a series of its own.
+        :param values: 2-d float array, NaN where there's no number
+        """
+        self.weeks = weeks
+        self.dates = dates
+        self.keys = keys
+        self.values = values
+        self.week_index = dict((week, i) for i, week in enumerate(weeks))
+        self.key_index = dict((key, i) for i, key in enumerate(keys))
+
+    @classmethod
+    def from_parsed(cls, parsed_data, statistic='count'):
+        """
+        Build the matrix of one statistic from a list of parsed files (TabFileParser or any subclass)
+        :param statistic: 'count' (the current week columns), 'median' or 'maximum' (the previous 52 weeks columns),
+            or 'cumulative' (year to date; only the current year's column is used)
+        :rtype : WeeklySeries
+        """
+        key_index = {}
+        keys = []
+        rows, columns, values = [], [], []
+
+        file_weeks = [parsed.metadata['year_and_week'] for parsed in parsed_data]
+        if not file_weeks:
+            return cls([], [], [], np.empty((0, 0)))
+        first, last = min(file_weeks), max(file_weeks)
+        calendar = week_range(first[0], last[0], first[1], last[1])
+        week_index = dict(((year, week), i) for i, (year, week, ending) in enumerate(calendar))
+
+        for parsed, week in zip(parsed_data, file_weeks):
+            table_data = parsed.table_data
+            row_ids = [label if row_id == UNMAPPED else row_id
+                       for label, row_id in zip(row_names(table_data), row_geography(table_data)[0])]
+
+            for column_name in table_data:
+                key = normalize_column_name(column_name)
+                if key is None or key.statistic != statistic:
+                    continue
+                if statistic == 'cumulative' and key.period != str(week[0]):
+                    continue
+                counts, codes = typed_column(table_data, column_name)
+                counts = np.frombuffer(counts, dtype=np.intc).astype(float)
+                codes = np.frombuffer(codes, dtype=np.int8)
+                counts[(codes != COUNT) & (codes != NO_CASES)] = np.nan
+
+                disease = series_name(key)
+                for row_id in row_ids:
+                    if (disease, row_id) not in key_index:
+                        key_index[(disease, row_id)] = len(keys)
+                        keys.append((disease, row_id))
+                rows.append([key_index[(disease, row_id)] for row_id in row_ids])
+                columns.append(np.repeat(week_index[week], len(row_ids)))
+                values.append(counts)
+
+        matrix = np.full((len(keys), len(calendar)), np.nan)
+        if values:
+            matrix[np.concatenate(rows), np.concatenate(columns)] = np.concatenate(values)
+        return cls([(year, week) for year, week, ending in calendar], [ending for year, week, ending in calendar],
+                   keys, matrix)
+
+    def aligned(self, other):
+        """
+        other's values rearranged to line up with this one's rows and columns (NaN where other has nothing)
+        :rtype : numpy.ndarray
+        """
+        matrix = np.full(self.values.shape, np.nan)
+        rows = [(i, other.key_index[key]) for i, key in enumerate(self.keys) if key in other.key_index]
+        columns = [(j, other.week_index[week]) for j, week in enumerate(self.weeks) if week in other.week_index]
+        if rows and columns:
+            mine, theirs = zip(*rows)
+            my_weeks, their_weeks = zip(*columns)
+            matrix[np.ix_(mine, my_weeks)] = other.values[np.ix_(theirs, their_weeks)]
+        return matrix
+
+    def label(self, row):
+        """
+        Readable name for a row, e.g. 'Syphilis, primary and secondary / OR'
+        """
+        disease, row_id = self.keys[row]
+        return '{0} / {1}'.format(disease, row_id if isinstance(row_id, basestring) else areas[row_id].code)
+
+
+def trailing_windows(values, window=52):
+    """
+    A view of values with a third axis holding, for each week, the window weeks before it (not including it). Nothing
+     is copied: the view is built with as_strided over a NaN-padded copy of the matrix.
+    :rtype : numpy.ndarray
+    """
+    nrows, nweeks = values.shape
+    padded = np.concatenate([np.full((nrows, window), np.nan), values], axis=1)
+    row_stride, week_stride = padded.strides
+    return as_strided(padded, shape=(nrows, nweeks, window), strides=(row_stride, week_stride, week_stride),
+                      writeable=False)
+
+
+def rolling_baseline(values, window=52, min_weeks=26, chunk_rows=256):
+    """
+    Median, maximum, mean and standard deviation of the previous window weeks, for every week of every series. The same
+     definition the CDC uses for its "previous 52 weeks" columns: the current week isn't included.
+    :param values: 2-d array, one row per series (e.g. WeeklySeries.values)
+    :param min_weeks: Weeks with fewer than this many numbers in their window get NaN
+    :param chunk_rows: Series to work on at once. The windows are copied when the medians are taken, so this bounds
+        memory use to about chunk_rows * weeks * window * 8 bytes.
+    :return: {'median': array, 'maximum': array, 'mean': array, 'std': array}, each the same shape as values
+    :rtype : dict
+    """
+    results = dict((name, np.full(values.shape, np.nan)) for name in ('median', 'maximum', 'mean', 'std'))
+
+    # Numbers in each window, from a running total instead of from the windows themselves
+    present = np.concatenate([np.zeros((values.shape[0], 1)), np.cumsum(~np.isnan(values), axis=1)], axis=1)
+    starts = np.maximum(np.arange(values.shape[1]) - window, 0)
+    enough = (present[:, :-1] - present[:, starts]) >= min_weeks
+
+    with warnings.catch_warnings():
+        # Windows that are all NaN are expected (the start of the archive, areas that never report)
+        warnings.simplefilter('ignore', RuntimeWarning)
+        for start in xrange(0, values.shape[0], chunk_rows):
+            windows = trailing_windows(values[start:start + chunk_rows], window)
+            results['median'][start:start + chunk_rows] = np.nanmedian(windows, axis=2)
+            results['maximum'][start:start + chunk_rows] = np.nanmax(windows, axis=2)
+            results['mean'][start:start + chunk_rows] = np.nanmean(windows, axis=2)
+            results['std'][start:start + chunk_rows] = np.nanstd(windows, axis=2)
+
+    for result in results.itervalues():
+        result[~enough] = np.nan
+    return results
+
+
+def week_over_week(values):
+    """
+    Change from the week before, for every week of every series (NaN where either week has no number)
+    :rtype : numpy.ndarray
+    """
+    deltas = np.full(values.shape, np.nan)
+    deltas[:, 1:] = values[:, 1:] - values[:, :-1]
+    return deltas
+
+
+def weekly_from_cumulative(cumulative):
+    """
+    Weekly counts rebuilt from year-to-date totals, for every series at once: each week's total minus the week
+     before's, except in week 1, where the total starts again from zero. Weeks where either total is missing are NaN.
+
+    Counts published early are provisional, and a later week's total sometimes comes out lower after they're revised.
+     Those weeks come out negative; they're kept, and flagged.
+    :param cumulative: WeeklySeries built with statistic='cumulative'
+    :return: (WeeklySeries of weekly counts, boolean array marking the weeks that came out negative)
+    :rtype : tuple
+    """
+    totals = cumulative.values
+    before = np.full(totals.shape, np.nan)
+    before[:, 1:] = totals[:, :-1]
+    before[:, np.array([week == 1 for year, week in cumulative.weeks], dtype=bool)] = 0
+
+    weekly = totals - before
+    with np.errstate(invalid='ignore'):
+        revised = weekly < 0
+    return WeeklySeries(cumulative.weeks, cumulative.dates, cumulative.keys, weekly), revised
+
+
+def fill_missing(counts, reconstructed):
+    """
+    counts' values, with the gaps (NaN) filled in from another WeeklySeries where it has a number, e.g. the weekly
+     counts rebuilt by weekly_from_cumulative. Negative reconstructed counts aren't used.
+    :rtype : numpy.ndarray
+    """
+    other = counts.aligned(reconstructed)
+    with np.errstate(invalid='ignore'):
+        other[other < 0] = np.nan
+    return np.where(np.isnan(counts.values), other, counts.values)
+
+
+def z_scores(values, baseline):
+    """
+    How many standard deviations each week is above the mean of its previous 52 weeks (from rolling_baseline). NaN
+     where there's no baseline, or the baseline never varied.
+    :rtype : numpy.ndarray
+    """
+    with np.errstate(invalid='ignore'):
+        std = np.where(baseline['std'] > 0, baseline['std'], np.nan)
+    return (values - baseline['mean']) / std
+
+
+def anomalies(series, z, threshold=3.0):
+    """
+    The (row label, week ending date, z-score) of every week scoring above threshold, highest first
+    :rtype : list
+    """
+    with np.errstate(invalid='ignore'):
+        rows, columns = np.nonzero(z > threshold)
+    found = [(series.label(i), series.dates[j], z[i, j]) for i, j in zip(rows, columns)]
+    return sorted(found, key=lambda item: -item[2])
+
+
+def compare_with_published(computed, series, published, tolerance=0.5):
+    """
+    Check a computed baseline against the one published in the tables.
+    :param computed: Array lined up with series, e.g. rolling_baseline(series.values)['median']
+    :param series: The WeeklySeries computed was worked out from
+    :param published: WeeklySeries of the matching published column (statistic='median' or 'maximum')
+    :param tolerance: Largest difference still counted as agreeing
+    :return: (number of cells where both have a number, fraction of those that agree, list of (row label, week ending
+        date, computed, published) for the ones that don't)
+    :rtype : tuple
+    """
+    expected = series.aligned(published)
+    both = ~np.isnan(computed) & ~np.isnan(expected)
+    compared = int(both.sum())
+    if not compared:
+        return 0, float('nan'), []
+    with np.errstate(invalid='ignore'):
+        differs = both & (np.abs(computed - expected) > tolerance)
+    mismatches = [(series.label(i), series.dates[j], computed[i, j], expected[i, j])
+                  for i, j in zip(*np.nonzero(differs))]
+    return compared, 1 - len(mismatches) / float(compared), mismatches
@@ -0,0 +1,151 @@
+#! /usr/bin/env python
+__author__ = 'Andrew Boughton and the A2 Hack for Change team'
+# Parse a whole list of tab files across a pool of worker processes. Parsing is CPU-bound, so on a multi-core machine
+# this scales with the number of cores, where [TabFileParser(f) for f in filename_list] uses only one.
+#
+# Any of the ways of getting a list of files in parse_table2_tabfiles can feed it, either from python:
+#   parsed_data, failures = parse_files(get_filenames_in_directory('../tabdatafiles'), filepath='../tabdatafiles')
+# or from the command line:
+#   python batch_parse.py --directory ../tabdatafiles --pattern '2*_wk*_table2*.tab' --processes 8
+
+import argparse
+import cPickle
+import multiprocessing
+import sys
+import traceback
+
+from column_names import unrecognised_columns
+from geography import find_collisions, unknown_codes
+from parse_cache import ParseCache
+from parse_table2_tabfiles import (ColumnarTabFileParser, get_filenames_from_file, get_filenames_in_directory,
+                                   get_tables_timerange)
+from tab_archive import TabArchive
+
+
+def _parse_one(job):
+    """
+    Parse a single file inside a worker process. Returns (filename, parsed object or None, error text or None)
+    """
+    filename, filepath, parser_class = job
+    try:
+        return filename, parser_class(filename, filepath=filepath), None
+    except Exception:
+        # A malformed file shouldn't sink the whole batch. Send back the traceback so it can be reported.
+        return filename, None, traceback.format_exc()
+
+
+def parse_files(filename_list, filepath='.', processes=None, parser_class=ColumnarTabFileParser, chunksize=16,
+                progress=True, cache=None):
+    """
+    Parse a list of files using a pool of worker processes. Results are compact ColumnarTabFileParser objects by
+    default, since every parsed file has to be pickled and sent back from the worker that parsed it.
+
+    Returns (list of parsed objects, list of (filename, error text) for files that couldn't be parsed). Parsed objects
+    are in the same order as filename_list, minus the failures.
+    :rtype : tuple
+    :param filename_list: Names of the files to parse, e.g. from get_filenames_in_directory()
+    :param filepath: Folder the files are in, or a TabArchive holding them
+    :param processes: Number of worker processes (defaults to the number of cores). 1 parses in this process.
+    :param parser_class: TabFileParser or a subclass of it
+    :param chunksize: Number of files handed to a worker at a time
+    :param progress: Print progress to stderr as files are parsed
+    :param cache: A ParseCache. Files already in it are loaded from it instead of being parsed, and everything that
+        does get parsed is added to it. Only this process touches the cache; the workers just parse. Only used when
+        filepath is a folder (cache entries are checked against the modification time of each file).
+    """
+    if not isinstance(filepath, basestring):
+        # Reading from a TabArchive
+        cache = None
+    cached = {}
+    if cache is not None:
+        for f in filename_list:
+            parsed = cache.get(f, filepath, parser_class)
+            if parsed is not None:
+                cached[f] = parsed
+    jobs = [(f, filepath, parser_class) for f in filename_list if f not in cached]
+
+    pool = None
+    if processes == 1 or not jobs:
+        results = (_parse_one(job) for job in jobs)
+    else:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap(_parse_one, jobs, chunksize)
+
+    parsed_by_name = {}
+    failures = []
+    try:
+        for i, (filename, parsed, error) in enumerate(results, 1):
+            if error is None:
+                parsed_by_name[filename] = parsed
+                if cache is not None:
+                    cache.put(filename, filepath, parsed, parser_class)
+            else:
+                failures.append((filename, error))
+            if progress and (i % 100 == 0 or i == len(jobs)):
+                sys.stderr.write('\rParsed {0}/{1} files, {2} failed'.format(i, len(jobs), len(failures)))
+                if i == len(jobs):
+                    sys.stderr.write('\n')
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    parsed_by_name.update(cached)
+    parsed_data = [parsed_by_name[f] for f in filename_list if f in parsed_by_name]
+    return parsed_data, failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Parse a batch of MMWR tab files across several processes')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--directory', help='parse every file in this folder matching --pattern')
+    source.add_argument('--listfile', help='parse the files named in this text file (one per line)')
+    source.add_argument('--archive', help='parse every file in this packed archive (see tab_archive.py)')
+    source.add_argument('--timerange', nargs=5, metavar=('STARTYEAR', 'ENDYEAR', 'STARTWEEK', 'ENDWEEK', 'TABLE'),
+                        help='parse one table over a range of weeks')
+    parser.add_argument('--pattern', default='*.tab', help='filename pattern to use with --directory')
+    parser.add_argument('--filepath', help='folder containing the tab files (defaults to --directory, or .)')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes (default: one per core)')
+    parser.add_argument('--chunksize', type=int, default=16, help='files handed to a worker at a time')
+    parser.add_argument('--cache', help='folder to cache parsed files in, so unchanged files are not parsed again')
+    parser.add_argument('--output', help='pickle the list of parsed objects to this file')
+    args = parser.parse_args()
+
+    if args.directory:
+        filename_list = get_filenames_in_directory(args.directory, pattern=args.pattern)
+    elif args.listfile:
+        filename_list = get_filenames_from_file(args.listfile)
+    elif args.archive:
+        filename_list = TabArchive(args.archive).filenames()
+    else:
+        startyear, endyear, startweek, endweek, tablename = args.timerange
+        filename_list = get_tables_timerange(int(startyear), int(endyear), int(startweek), int(endweek), tablename)
+    filepath = TabArchive(args.archive) if args.archive else (args.filepath or args.directory or '.')
+
+    cache = ParseCache(args.cache) if args.cache else None
+    parsed_data, failures = parse_files(filename_list, filepath=filepath, processes=args.processes,
+                                        chunksize=args.chunksize, cache=cache)
+
+    print 'Parsed {0} files, {1} failed'.format(len(parsed_data), len(failures))
+    unmapped = sorted(set(label for parsed in parsed_data for label in parsed.unmapped_geography))
+    if unmapped:
+        print 'Row labels that are not known reporting areas (add them to lookup_data.geography):'
+        for label in unmapped:
+            print '   ', repr(label)
+    for code, labels in sorted(find_collisions().iteritems()):
+        print 'lookup_data.geography maps several labels to {0}: {1}'.format(code, ', '.join(map(repr, labels)))
+    for code in unknown_codes():
+        print 'lookup_data.geography uses a code that is not in geography.py: {0!r}'.format(code)
+    unrecognised = unrecognised_columns(set(column for parsed in parsed_data for column in parsed.table_data))
+    if unrecognised:
+        print 'Column names whose statistic is not recognised (see column_names.STATISTIC_PATTERN):'
+        for column_name in sorted(unrecognised):
+            print '   ', repr(column_name)
+    for filename, error in failures:
+        print ''
+        print 'Could not parse', filename
+        print error
+
+    if args.output:
+        with open(args.output, 'wb') as f:
+            cPickle.dump(parsed_data, f, cPickle.HIGHEST_PROTOCOL)
@@ -0,0 +1,122 @@
+__author__ = 'Andrew Boughton and the A2 Hack for Change team'
+# Turn raw column headers into structured keys, so the same series can be followed across years even though the
+# header text changes (typos like "Syphillis" and "cummulative", footnote symbols, renamed diseases, the 2H -> 2J move):
+#   normalize_column_name('Syphillis, primary & secondary current week')
+#       -> ColumnKey(disease='Syphilis', subtype='primary and secondary', statistic='count', period='current week')
+#   normalize_column_name('Syphilis (primary and secondary)\xa7 cummulative for 2010')
+#       -> ColumnKey(disease='Syphilis', subtype='primary and secondary', statistic='cumulative', period='2010')
+# Every header in lookup_data.column_metadata is normalized once, when this module is imported; after that a lookup is
+# a single dict access. Headers that haven't been seen before are worked out on first use and remembered.
+# A header whose statistic isn't recognised still gets a key, with statistic UNKNOWN_STATISTIC, so its data is kept
+# rather than silently dropped; unrecognised_columns() lists them. Only Reporting Area gets None.
+
+import re
+from collections import namedtuple
+
+from lookup_data import column_metadata, disease_names
+
+ColumnKey = namedtuple('ColumnKey', 'disease subtype statistic period')
+
+# Column names end with the statistic they hold, e.g. "Mumps previous 52 weeks median "
+STATISTIC_PATTERN = re.compile(
+    r'^(.*?)\s*(current week|cumm?ulative for (\d{4})|previous 52 weeks (median|maximum))\s*$')
+
+# Statistic of a data column whose header doesn't match STATISTIC_PATTERN
+UNKNOWN_STATISTIC = 'unknown'
+
+# Columns that don't hold data (compared after clean_disease_name)
+NON_DATA_COLUMNS = frozenset(['reporting area'])
+
+# Footnote markers: asterisks, and the Windows-1252 symbols (daggers, section signs...) used in the publication.
+#  Shared with geography.py and search_index.py, which strip them from row labels and headings the same way.
+FOOTNOTES = re.compile(r'[*\x80-\xff]+')
+
+_known_columns = {}
+
+
+def clean_disease_name(text):
+    """
+    Disease part of a column name, reduced to the form used for the keys of lookup_data.disease_names
+    """
+    text = FOOTNOTES.sub(' ', text)
+    text = ' '.join(text.split()).replace(' ,', ',')
+    return text.strip(' ,').lower()
+
+
+def _build_key(column_name):
+    if clean_disease_name(column_name) in NON_DATA_COLUMNS:
+        return None
+    match = STATISTIC_PATTERN.match(column_name)
+    if match is None:
+        # A data column in a format we don't know yet. The whole header is used as the disease, so it stays distinct.
+        raw_disease, statistic, period = column_name, UNKNOWN_STATISTIC, ''
+    else:
+        raw_disease, statistic_text, cumulative_year, summary = match.groups()
+        if cumulative_year:
+            statistic, period = 'cumulative', cumulative_year
+        elif summary:
+            statistic, period = summary, 'previous 52 weeks'
+        else:
+            statistic, period = 'count', 'current week'
+
+    cleaned = clean_disease_name(raw_disease)
+    if cleaned in disease_names:
+        disease, subtype = disease_names[cleaned]
+    else:
+        # Not in the lookup table yet. Best guess: anything after the first comma is the subtype.
+        original = ' '.join(FOOTNOTES.sub(' ', raw_disease).split()).replace(' ,', ',').strip(' ,')
+        disease, _, subtype = original.partition(',')
+        disease, subtype = disease.strip(), subtype.strip()
+    return ColumnKey(disease, subtype, statistic, period)
+
+
+def normalize_column_name(column_name):
+    """
+    Structured key for a raw column header, or None for columns that don't hold data (Reporting Area). Data columns
+     whose statistic isn't recognised get statistic UNKNOWN_STATISTIC.
+    :rtype : ColumnKey
+    """
+    try:
+        return _known_columns[column_name]
+    except KeyError:
+        key = _known_columns[column_name] = _build_key(column_name)
+        return key
+
+
+def series_name(key):
+    """
+    Name of the disease a key refers to, including its subtype, e.g. 'Syphilis, primary and secondary'
+    """
+    return '{0}, {1}'.format(key.disease, key.subtype) if key.subtype else key.disease
+
+
+def unknown_diseases(column_names):
+    """
+    Column names whose disease isn't in lookup_data.disease_names (so their key is only a best guess). Use this to
+     find out what needs adding when a new year of files is downloaded.
+    :rtype : list
+    """
+    unknown = []
+    for column_name in column_names:
+        match = STATISTIC_PATTERN.match(column_name)
+        if match and clean_disease_name(match.group(1)) not in disease_names:
+            unknown.append(column_name)
+    return unknown
+
+
+def unrecognised_columns(column_names):
+    """
+    Column names that look like data columns but whose statistic isn't recognised (see STATISTIC_PATTERN). Their data
+     is kept, under statistic UNKNOWN_STATISTIC, but the pattern probably needs updating for them.
+    :rtype : list
+    """
+    unrecognised = []
+    for column_name in column_names:
+        key = normalize_column_name(column_name)
+        if key is not None and key.statistic == UNKNOWN_STATISTIC:
+            unrecognised.append(column_name)
+    return unrecognised
+
+
+for _column_name in column_metadata:
+    normalize_column_name(_column_name)
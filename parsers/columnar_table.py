@@ -0,0 +1,294 @@
+__author__ = 'Andrew Boughton and the A2 Hack for Change team'
+# Compact, array-backed storage for the data section of one tab file. The nested dicts built by
+# TabFileParser.parse_tabledata hold one string per cell and repeat every row name once per column, which adds up fast
+# across ~8k files. Here each table is instead:
+#   - tuples of row and column names (interned, so the same name is stored only once across every table in memory),
+#     plus a small array of the geography ID for each row
+#   - one flat array of integer counts, row-major (n_rows * n_columns)
+#   - one flat array of small codes saying what kind of cell each one was (a number, or one of the footnote codes
+#     like N, U or -) so missing values can't be mistaken for counts
+#   - the original text of the few cells whose text isn't just their count or code written out ('1,234', en dashes,
+#     row names), so nothing is lost
+# and a dict-like view is provided, so code written for table_data[column_name][row_name] keeps working.
+
+from array import array
+from itertools import compress
+
+from geography import geography_ids
+
+# Cell codes
+COUNT = 0           # A number. The count is in the counts array.
+NO_CASES = 1        # "-": No reported cases. Count is stored as 0.
+NOT_NOTIFIABLE = 2  # "N": Not notifiable
+UNAVAILABLE = 3     # "U": Unavailable
+BLANK = 4           # Empty cell
+OTHER = 5           # Anything else (like the row names themselves, in the first column). Original text is kept.
+NO_DATA = 6         # Not in the table at all: the row (or column) wasn't published that week
+
+CODE_TEXT = {NO_CASES: '-',
+             NOT_NOTIFIABLE: 'N',
+             UNAVAILABLE: 'U',
+             BLANK: ''}
+
+# The publication uses a dash for "no reported cases"; depending on the year it comes through as a plain hyphen or a
+# Windows-1252 en/em dash
+_TEXT_CODES = {'-': NO_CASES, '\x96': NO_CASES, '\x97': NO_CASES,
+               'N': NOT_NOTIFIABLE,
+               'U': UNAVAILABLE,
+               '': BLANK}
+
+
+def convert_cell(text):
+    """
+    Turn the text of one cell into a (count, code) pair
+    :rtype : tuple
+    """
+    text = text.strip()
+    digits = text.replace(',', '')
+    if digits.isdigit():
+        return int(digits), COUNT
+    return 0, _TEXT_CODES.get(text, OTHER)
+
+
+def convert_cells(cells):
+    """
+    Convert a whole table's worth of cell text at once. Returns (counts, codes, other_text), as used by ColumnarTable.
+    other_text holds the original text of every cell that can't be written back out from its count and code alone.
+
+    Tables are mostly made of a few hundred distinct strings (small counts, N, U, -) repeated over and over, so each
+    distinct string is converted only once and the results are then mapped across every cell in bulk.
+    :param cells: Sequence of cell text
+    :rtype : tuple
+    """
+    converted = dict((text, convert_cell(text)) for text in set(cells))
+    count_of = dict((text, value[0]) for text, value in converted.iteritems())
+    code_of = dict((text, value[1]) for text, value in converted.iteritems())
+
+    counts = array('i', map(count_of.__getitem__, cells))
+    codes = array('b', map(code_of.__getitem__, cells))
+
+    # Text that wouldn't come back the same from cell_text: thousands separators, other dashes, stray spaces, OTHER
+    differs = set(text for text, (count, code) in converted.iteritems()
+                  if text != (str(count) if code == COUNT else CODE_TEXT.get(code)))
+    other_text = {}
+    if differs:
+        for i in compress(xrange(len(cells)), (text in differs for text in cells)):
+            other_text[i] = intern(cells[i])
+    return counts, codes, other_text
+
+
+def typed_cell(table_data, column_name, row_name):
+    """
+    Typed value of one cell from either a ColumnarTable or a TabFileParser-style dict of dicts, as a (count, code) pair.
+    Count is None unless the cell holds a number (or "-", meaning zero cases). A row that isn't in the table at all
+    comes back as (None, NO_DATA).
+    :rtype : tuple
+    """
+    if isinstance(table_data, ColumnarTable):
+        if row_name not in table_data.row_index:
+            return None, NO_DATA
+        count, code = table_data.cell(column_name, row_name)
+    else:
+        text = table_data[column_name].get(row_name)
+        if text is None:
+            return None, NO_DATA
+        count, code = convert_cell(text)
+    return (count if code in (COUNT, NO_CASES) else None), code
+
+
+def row_names(table_data):
+    """
+    Row names of either a ColumnarTable or a TabFileParser-style dict of dicts, in table order
+    :rtype : list
+    """
+    if isinstance(table_data, ColumnarTable):
+        return list(table_data.row_names)
+    if not table_data:
+        return []
+    return table_data[next(iter(table_data))].keys()
+
+
+def row_geography(table_data):
+    """
+    Geography ID of each row of either kind of table (lined up with row_names()), and the row names that aren't known
+     reporting areas. See geography.geography_ids.
+    :rtype : tuple
+    """
+    if isinstance(table_data, ColumnarTable):
+        return table_data.row_geography, table_data.unmapped_rows
+    return geography_ids(row_names(table_data))
+
+
+def typed_column(table_data, column_name):
+    """
+    Counts and codes for every row of one column of either kind of table, lined up with row_names(). Counts are 0
+     wherever the code says there is no number.
+    :rtype : tuple
+    """
+    if isinstance(table_data, ColumnarTable):
+        return table_data.column(column_name)
+    column = table_data[column_name]
+    cells = [convert_cell(column[row_name]) for row_name in row_names(table_data)]
+    return array('i', [count for count, code in cells]), array('b', [code for count, code in cells])
+
+
+class ColumnarTable(object):
+    """
+    The data section of one tab file, stored as arrays (see top of file). Behaves like the read-only nested dict that
+    TabFileParser.parse_tabledata produces: table[column_name][row_name] gives the text of the cell exactly as it was
+    in the file, and the usual read-only dict methods (keys, values, items, their iter versions, get, `in`, len and
+    iteration) work on column names.
+
+    For typed access, use cell() or the .counts and .codes arrays directly.
+    """
+
+    def __init__(self, column_names, row_names, counts, codes, other_text=None):
+        """
+        :param column_names: Sequence of column names
+        :param row_names: Sequence of row names
+        :param counts: array of cell counts, row-major
+        :param codes: array of cell codes (COUNT, NO_CASES...) lined up with counts
+        :param other_text: {flat cell index: original text} for cells whose text can't be rebuilt from count and code
+        """
+        self.column_names = tuple(intern(c) for c in column_names)
+        self.row_names = tuple(intern(r) for r in row_names)
+        self.counts = counts
+        self.codes = codes
+        self.other_text = other_text or {}
+
+        self.column_index = dict((c, i) for i, c in enumerate(self.column_names))
+        self.row_index = dict((r, i) for i, r in enumerate(self.row_names))
+        # Geography ID of each row (see geography.py), and the row names that aren't known reporting areas
+        self.row_geography, self.unmapped_rows = geography_ids(self.row_names)
+
+    def __reduce__(self):
+        # Pickle just the arrays and names. Unpickling goes back through __init__, which re-interns the names and
+        # rebuilds the indexes- so tables sent back from worker processes share name strings like any other.
+        return ColumnarTable, (self.column_names, self.row_names, self.counts, self.codes, self.other_text)
+
+    @classmethod
+    def from_rows(cls, column_names, rows):
+        """
+        Build a table from an iterable of (row name, list of cell text) pairs, such as a StreamingTabFileParser
+        """
+        ncolumns = len(column_names)
+        row_names = []
+        cells = []
+        for row_name, row_values in rows:
+            row_names.append(row_name)
+            cells.extend(row_values[:ncolumns])
+            if len(row_values) < ncolumns:
+                # Short row- treat the missing cells as blank
+                cells.extend([''] * (ncolumns - len(row_values)))
+
+        counts, codes, other_text = convert_cells(cells)
+        return cls(column_names, row_names, counts, codes, other_text)
+
+    @property
+    def shape(self):
+        return len(self.row_names), len(self.column_names)
+
+    def cell(self, column_name, row_name):
+        """
+        Typed value of one cell, as a (count, code) pair
+        :rtype : tuple
+        """
+        index = self.row_index[row_name] * len(self.column_names) + self.column_index[column_name]
+        return self.counts[index], self.codes[index]
+
+    def column(self, column_name):
+        """
+        Counts and codes for every row of one column, lined up with .row_names
+        :rtype : tuple
+        """
+        start, step = self.column_index[column_name], len(self.column_names)
+        return self.counts[start::step], self.codes[start::step]
+
+    def cell_text(self, index):
+        """
+        Text of a cell, given its position in the flat arrays
+        """
+        text = self.other_text.get(index)
+        if text is not None:
+            return text
+        code = self.codes[index]
+        if code == COUNT:
+            return str(self.counts[index])
+        return CODE_TEXT[code]
+
+    # Read-only dict interface, keyed by column name
+    def __getitem__(self, column_name):
+        return ColumnView(self, self.column_index[column_name])
+
+    def get(self, column_name, default=None):
+        return self[column_name] if column_name in self.column_index else default
+
+    def __contains__(self, column_name):
+        return column_name in self.column_index
+
+    def __iter__(self):
+        return iter(self.column_names)
+
+    def __len__(self):
+        return len(self.column_names)
+
+    def keys(self):
+        return list(self.column_names)
+
+    def iterkeys(self):
+        return iter(self.column_names)
+
+    def values(self):
+        return [self[c] for c in self.column_names]
+
+    def itervalues(self):
+        return (self[c] for c in self.column_names)
+
+    def items(self):
+        return [(c, self[c]) for c in self.column_names]
+
+    def iteritems(self):
+        return ((c, self[c]) for c in self.column_names)
+
+
+class ColumnView(object):
+    """
+    One column of a ColumnarTable, as a read-only dict of row name -> cell text
+    """
+
+    def __init__(self, table, column):
+        self.table = table
+        self.column = column
+
+    def __getitem__(self, row_name):
+        return self.table.cell_text(self.table.row_index[row_name] * len(self.table.column_names) + self.column)
+
+    def get(self, row_name, default=None):
+        return self[row_name] if row_name in self.table.row_index else default
+
+    def __contains__(self, row_name):
+        return row_name in self.table.row_index
+
+    def __iter__(self):
+        return iter(self.table.row_names)
+
+    def __len__(self):
+        return len(self.table.row_names)
+
+    def keys(self):
+        return list(self.table.row_names)
+
+    def iterkeys(self):
+        return iter(self.table.row_names)
+
+    def values(self):
+        return [self[r] for r in self.table.row_names]
+
+    def itervalues(self):
+        return (self[r] for r in self.table.row_names)
+
+    def items(self):
+        return [(r, self[r]) for r in self.table.row_names]
+
+    def iteritems(self):
+        return ((r, self[r]) for r in self.table.row_names)
@@ -0,0 +1,127 @@
+__author__ = 'Andrew Boughton and the A2 Hack for Change team'
+# Read and write tab files compressed on disk. The text is very repetitive, so it shrinks to a fraction of its size.
+# Three layouts are understood, and can be mixed in the same folder:
+#   2007_wk09_table2H.tab.gz     one gzip file per tab file
+#   2007_wk09_table2H.tab.bz2    one bzip2 file per tab file (smaller, slower)
+#   2007.zip                     one zip bundle per year, holding that year's tab files as members
+# Readers don't need to know which was used: read_tabfile('2007_wk09_table2H.tab', '../tabdatafiles') finds the plain
+# file or whichever compressed copy exists, and get_filenames_in_directory lists them all under their plain names.
+#
+# The python 2 standard library has no xz or zstd support, so those aren't offered.
+
+import bz2
+import gzip
+import os
+import re
+import threading
+import zipfile
+
+from persistence import atomic_file
+
+# Compression name: (suffix added to the tab file name, function to open it with)
+COMPRESSORS = {'gz': ('.gz', gzip.open),
+               'bz2': ('.bz2', bz2.BZ2File)}
+
+# Per-year bundles are named after the year: 2007.zip
+_BUNDLE = re.compile(r'^(\d{4})\.zip$')
+
+
+def bundle_name(filename):
+    """
+    Name of the per-year bundle a standard tab file name ({year}_wk{week}_table{name}.tab) would be stored in
+    """
+    return filename[:4] + '.zip'
+
+
+def find_tabfile(filename, filepath='.'):
+    """
+    Where a tab file is actually stored: the plain file, a compressed copy, or the year bundle holding it (checked in
+     that order). Returns (path on disk, compression), where compression is None, 'gz', 'bz2' or 'zip'. Raises IOError
+     if there's no copy at all.
+    :rtype : tuple
+    """
+    fullfilename = os.path.join(filepath, filename)
+    if os.path.exists(fullfilename):
+        return fullfilename, None
+    for compression, (suffix, opener) in sorted(COMPRESSORS.iteritems()):
+        if os.path.exists(fullfilename + suffix):
+            return fullfilename + suffix, compression
+    bundle = os.path.join(filepath, bundle_name(filename))
+    if os.path.exists(bundle):
+        with zipfile.ZipFile(bundle) as z:
+            if filename in z.NameToInfo:
+                return bundle, 'zip'
+    raise IOError('No such tab file (plain, compressed or bundled): {0}'.format(fullfilename))
+
+
+def read_tabfile(filename, filepath='.'):
+    """
+    Contents of a tab file, wherever and however it's stored (see find_tabfile)
+    :rtype : str
+    """
+    path, compression = find_tabfile(filename, filepath)
+    if compression == 'zip':
+        with zipfile.ZipFile(path) as z:
+            return z.read(filename)
+    opener = COMPRESSORS[compression][1] if compression else open
+    f = opener(path, 'rb')
+    try:
+        return f.read()
+    finally:
+        f.close()
+
+
+def write_tabfile(fullfilename, contents, compression=None):
+    """
+    Write a tab file, compressed per-file if asked ('gz' or 'bz2'; the suffix is added to the name). Goes through a
+     temporary name, so an interrupted write never leaves a truncated file behind.
+    :return: Name of the file written
+    """
+    if compression:
+        suffix, opener = COMPRESSORS[compression]
+        fullfilename += suffix
+    else:
+        opener = open
+    with atomic_file(fullfilename, opener) as f:
+        f.write(contents)
+    return fullfilename
+
+
+class BundleWriter(object):
+    def __init__(self, directory):
+        """
+        Adds tab files to per-year zip bundles in a folder. Safe to share between threads. Each bundle is closed after
+         every file is added, so it's always readable even if the crawl writing it is interrupted.
+        """
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def add(self, filename, contents):
+        """
+        Add a tab file to its year's bundle. A file that's already there is replaced (the newer copy is the one read).
+        :return: Name of the bundle written to
+        """
+        bundle = os.path.join(self.directory, bundle_name(filename))
+        with self._lock:
+            with zipfile.ZipFile(bundle, 'a', zipfile.ZIP_DEFLATED) as z:
+                if filename in z.NameToInfo:
+                    # The old copy stays in the bundle, but the last one wins on reading. Forgetting it here just stops
+                    #  zipfile from warning about the duplicate name.
+                    del z.NameToInfo[filename]
+                z.writestr(filename, contents)
+        return bundle
+
+
+def bundled_filenames(directory):
+    """
+    Names of the tab files held in every year bundle in a folder
+    :rtype : list
+    """
+    names = set()
+    if not os.path.isdir(directory):
+        return []
+    for bundle in os.listdir(directory):
+        if _BUNDLE.match(bundle):
+            with zipfile.ZipFile(os.path.join(directory, bundle)) as z:
+                names.update(z.namelist())
+    return sorted(names)
@@ -0,0 +1,209 @@
+#! /usr/bin/env python
+__author__ = 'Andrew Boughton and the A2 Hack for Change team'
+# Export a parsed archive to compressed numpy .npz files, one per MMWR year, with a column (array) per field and one
+# entry per datapoint:
+#   date, year, week                week ending date (datetime64[D]) and MMWR year and week
+#   table, disease, statistic,      dictionary-encoded: small integer codes, with the strings they stand for stored
+#   period, column, geography_label   alongside as <name>_names (e.g. disease_names[disease[i]])
+#   geography                       geography ID from geography.py (the same across years; -1 if unknown), with the
+#                                     codes in geography_names (index by geography + 1)
+#   value, code                     the count, and the cell code from columnar_table saying whether there is one
+# Strings are stored as raw bytes, so the footnote symbols (\xa7, \x86...) that tripped up JSON output are no problem.
+#
+#   python export_npz.py --directory ../tabdatafiles --output ../export
+#   python export_npz.py --archive ../mmwr.tabpack --output ../export
+#
+# .npz members are only read when asked for, so a reader only pays for the years and columns it uses:
+#   data = np.load('../export/mmwr_2010.npz')
+#   diseases = data['disease_names'][data['disease']]
+# or, for every year at once, read_export('../export', columns=['date', 'disease', 'geography', 'value']).
+# (Parquet would be the obvious format for this, but there's no Parquet library for python 2 in this project.)
+
+import argparse
+import glob
+import os
+import re
+
+import numpy as np
+
+from batch_parse import parse_files
+from column_names import normalize_column_name, series_name
+from columnar_table import row_geography, row_names, typed_column
+from geography import areas
+from parse_cache import ParseCache
+from parse_table2_tabfiles import get_filenames_in_directory, parse_filename
+from persistence import atomic_file
+from tab_archive import TabArchive
+
+# Fields that are dictionary-encoded, and the dtype of their codes
+ENCODED_FIELDS = (('table', np.int16), ('disease', np.int16), ('statistic', np.int8), ('period', np.int16),
+                  ('column', np.int32), ('geography_label', np.int16))
+
+_EXPORT_NAME = re.compile(r'^mmwr_(\d{4})\.npz$')
+
+
+class _Dictionary(object):
+    """
+    Assigns each distinct string a code, in order of first appearance
+    """
+
+    def __init__(self):
+        self.codes = {}
+        self.names = []
+
+    def encode(self, name):
+        if name not in self.codes:
+            self.codes[name] = len(self.names)
+            self.names.append(name)
+        return self.codes[name]
+
+
+def year_arrays(parsed_data):
+    """
+    Columns for one chunk of the export, from a list of parsed files (normally a single year's)
+    :return: {field name: numpy array}, including the <field>_names arrays of the dictionary-encoded fields
+    :rtype : dict
+    """
+    dictionaries = dict((name, _Dictionary()) for name, dtype in ENCODED_FIELDS)
+    chunks = dict((name, []) for name in ('date', 'year', 'week', 'geography', 'value', 'code') +
+                  tuple(name for name, dtype in ENCODED_FIELDS))
+
+    for parsed in parsed_data:
+        metadata = parsed.metadata
+        table_data = parsed.table_data
+        labels = row_names(table_data)
+        nrows = len(labels)
+        if not nrows:
+            continue
+        labels = np.array([dictionaries['geography_label'].encode(r) for r in labels], dtype=np.int16)
+        row_ids = np.array(row_geography(table_data)[0], dtype=np.int16)
+        table = dictionaries['table'].encode(metadata['table_name'])
+
+        for column_name in table_data:
+            key = normalize_column_name(column_name)
+            if key is None:
+                continue
+            counts, codes = typed_column(table_data, column_name)
+            counts = np.frombuffer(counts, dtype=np.intc).astype(np.int32)
+            codes = np.frombuffer(codes, dtype=np.int8)
+
+            chunks['value'].append(counts)
+            chunks['code'].append(codes)
+            chunks['geography'].append(row_ids)
+            chunks['geography_label'].append(labels)
+            for name, value in (('date', np.datetime64(metadata['date'], 'D')),
+                                ('year', metadata['year_and_week'][0]),
+                                ('week', metadata['year_and_week'][1]),
+                                ('table', table),
+                                ('disease', dictionaries['disease'].encode(series_name(key))),
+                                ('statistic', dictionaries['statistic'].encode(key.statistic)),
+                                ('period', dictionaries['period'].encode(key.period)),
+                                ('column', dictionaries['column'].encode(column_name))):
+                chunks[name].append(np.repeat(value, nrows))
+
+    if not chunks['value']:
+        return {}
+    arrays = dict((name, np.concatenate(parts)) for name, parts in chunks.iteritems())
+    arrays['year'] = arrays['year'].astype(np.int16)
+    arrays['week'] = arrays['week'].astype(np.int8)
+    for name, dtype in ENCODED_FIELDS:
+        arrays[name] = arrays[name].astype(dtype)
+        arrays[name + '_names'] = np.array(dictionaries[name].names, dtype=np.string_)
+    # Geography IDs are the same in every chunk, so the full list of codes goes in each one. -1 (unknown) is index 0.
+    arrays['geography_names'] = np.array(['unknown'] + [a.code for a in areas], dtype=np.string_)
+    return arrays
+
+
+def export_npz(parsed_data, directory):
+    """
+    Write a parsed archive out as one mmwr_{year}.npz file per MMWR year (see top of file for what's in them)
+    :return: List of the files written
+    :rtype : list
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    by_year = {}
+    for parsed in parsed_data:
+        by_year.setdefault(parsed.metadata['year_and_week'][0], []).append(parsed)
+
+    written = []
+    for year in sorted(by_year):
+        arrays = year_arrays(sorted(by_year[year],
+                                    key=lambda p: (p.metadata['year_and_week'], p.metadata['table_name'])))
+        if not arrays:
+            continue
+        path = os.path.join(directory, 'mmwr_{0}.npz'.format(year))
+        with atomic_file(path) as f:
+            np.savez_compressed(f, **arrays)
+        written.append(path)
+    return written
+
+
+def export_files(filename_list, directory, filepath='.', processes=None, cache=None):
+    """
+    Parse a list of files and export them, a year at a time, so only one year's parsed files are held at once
+    :param filepath: Folder the files are in, or a TabArchive holding them (see batch_parse.parse_files)
+    :return: (list of the files written, list of (filename, error) for files that couldn't be parsed)
+    :rtype : tuple
+    """
+    by_year = {}
+    for filename in filename_list:
+        by_year.setdefault(parse_filename(filename)[0], []).append(filename)
+
+    written, failures = [], []
+    for year in sorted(by_year):
+        parsed_data, year_failures = parse_files(by_year[year], filepath=filepath, processes=processes, cache=cache,
+                                                 progress=False)
+        written.extend(export_npz(parsed_data, directory))
+        failures.extend(year_failures)
+    return written, failures
+
+
+def read_export(directory, years=None, columns=None):
+    """
+    Read an export back, concatenating the chosen years. Dictionary-encoded fields are decoded into their strings, and
+     geography into geography codes.
+    :param years: Years to read (default: all of them)
+    :param columns: Fields to read (default: all of them). Only these are decompressed.
+    :rtype : dict
+    """
+    paths = sorted(glob.glob(os.path.join(directory, 'mmwr_*.npz')))
+    chunks = {}
+    for path in paths:
+        if years is not None and int(_EXPORT_NAME.match(os.path.basename(path)).group(1)) not in years:
+            continue
+        data = np.load(path)
+        fields = columns or [name for name in data.files if not name.endswith('_names')]
+        for name in fields:
+            values = data[name]
+            if name + '_names' in data.files:
+                offset = 1 if name == 'geography' else 0
+                values = data[name + '_names'][values + offset]
+            chunks.setdefault(name, []).append(values)
+        data.close()
+    return dict((name, np.concatenate(parts)) for name, parts in chunks.iteritems())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export MMWR tab files to compressed numpy files, one per year')
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--directory', default='../tabdatafiles', help='folder of tab files to export')
+    source.add_argument('--archive', help='export every file in this packed archive (see tab_archive.py)')
+    parser.add_argument('--pattern', default='*.tab', help='filename pattern to match in --directory')
+    parser.add_argument('--output', default='../export', help='folder to write mmwr_{year}.npz files into')
+    parser.add_argument('--processes', type=int, default=None, help='parser processes (default: one per core)')
+    parser.add_argument('--cache', help='folder to cache parsed files in, so unchanged files are not parsed again')
+    args = parser.parse_args()
+
+    if args.archive:
+        filepath = TabArchive(args.archive)
+        filename_list = filepath.filenames()
+    else:
+        filepath = args.directory
+        filename_list = get_filenames_in_directory(args.directory, pattern=args.pattern)
+    written, failures = export_files(filename_list, args.output, filepath=filepath, processes=args.processes,
+                                     cache=ParseCache(args.cache) if args.cache else None)
+    for path in written:
+        print 'Wrote', path
+    for filename, error in failures:
+        print 'Could not parse', filename
@@ -0,0 +1,106 @@
+__author__ = 'Andrew Boughton and the A2 Hack for Change team'
+# A running catalog of every column and row heading in the archive: when each was first and last seen (week and
+# table), and how many files it has appeared in. It's saved to disk and only ever needs to look at files it hasn't seen
+# before, so keeping it up to date after a download is a few files' worth of work rather than a pass over the archive:
+#   catalog = FieldCatalog('../field_catalog.pickle')
+#   catalog.update(get_filenames_in_directory('../tabdatafiles'), filepath='../tabdatafiles')
+#   catalog.save()
+# and checking a new week against everything seen before is a handful of set lookups:
+#   new_columns, new_rows, dropped_columns = catalog.check(ColumnarTabFileParser('2013_wk22_table2H.tab'))
+
+from collections import namedtuple
+
+from columnar_table import row_names
+from persistence import PickledIndex
+
+# first_seen and last_seen are (year, week, table name)
+Sighting = namedtuple('Sighting', 'first_seen last_seen count')
+
+
+def _week_of(parsed):
+    """
+    (year, week, table name) of a parsed file
+    """
+    metadata = parsed.metadata
+    return metadata['year_and_week'] + (metadata['table_name'],)
+
+
+class FieldCatalog(PickledIndex):
+    fields = ('files', 'columns', 'rows', 'table_columns')
+
+    def __init__(self, filename='field_catalog.pickle'):
+        """
+        :param filename: File the catalog is kept in. Loaded if it already exists.
+        """
+        self.files = {}             # filename: (year, week, table name)
+        self.columns = {}           # column heading: Sighting
+        self.rows = {}              # row heading: Sighting
+        self.table_columns = {}     # table name: (year, week, set of column headings in the latest file of that table)
+
+        PickledIndex.__init__(self, filename)
+
+    def __contains__(self, filename):
+        return filename in self.files
+
+    def _record(self, catalog, headings, seen):
+        new = []
+        for heading in headings:
+            sighting = catalog.get(heading)
+            if sighting is None:
+                catalog[heading] = Sighting(seen, seen, 1)
+                new.append(heading)
+            else:
+                catalog[heading] = Sighting(min(sighting.first_seen, seen), max(sighting.last_seen, seen),
+                                            sighting.count + 1)
+        return new
+
+    def add(self, parsed):
+        """
+        Add the headings of one parsed file (TabFileParser or any subclass). Files already in the catalog are skipped.
+        :return: (list of column headings never seen before, list of row headings never seen before)
+        :rtype : tuple
+        """
+        filename = parsed.metadata['filename']
+        if filename in self.files:
+            return [], []
+        seen = self.files[filename] = _week_of(parsed)
+
+        column_names = list(parsed.table_data)
+        new_columns = self._record(self.columns, column_names, seen)
+        new_rows = self._record(self.rows, row_names(parsed.table_data), seen)
+
+        year, week, table_name = seen
+        if (year, week) >= self.table_columns.get(table_name, (0, 0))[:2]:
+            self.table_columns[table_name] = (year, week, set(column_names))
+        return new_columns, new_rows
+
+    def update(self, filename_list, filepath='.', processes=None, cache=None):
+        """
+        Bring the catalog up to date with a list of files, parsing only the ones it hasn't seen yet (see batch_parse).
+        :return: ({filename: (new column headings, new row headings)} for files that added anything new,
+                  list of (filename, error) for files that couldn't be parsed)
+        :rtype : tuple
+        """
+        parsed_data, failures = self.parse_unseen(filename_list, filepath=filepath, processes=processes, cache=cache)
+
+        changes = {}
+        for parsed in sorted(parsed_data, key=_week_of):
+            new_columns, new_rows = self.add(parsed)
+            if new_columns or new_rows:
+                changes[parsed.metadata['filename']] = (new_columns, new_rows)
+        return changes, failures
+
+    def check(self, parsed):
+        """
+        Compare one parsed file against the catalog, without adding it.
+        :return: (column headings never seen before, row headings never seen before,
+                  column headings in the latest earlier file of the same table that this file doesn't have)
+        :rtype : tuple
+        """
+        column_names = set(parsed.table_data)
+        new_columns = sorted(c for c in column_names if c not in self.columns)
+        new_rows = sorted(r for r in row_names(parsed.table_data) if r not in self.rows)
+
+        previous = self.table_columns.get(parsed.metadata['table_name'])
+        dropped_columns = sorted(previous[2] - column_names) if previous else []
+        return new_columns, new_rows, dropped_columns
@@ -0,0 +1,130 @@
+__author__ = 'Andrew Boughton and the A2 Hack for Change team'
+# Turn reporting area (row) labels into small integer geography IDs, once per file at parse time, using the
+# lookup_data.geography mapping. Every ID also knows where it sits in the hierarchy the table is laid out in:
+#   UNITED STATES -> region (NEW ENGLAND, MID. ATLANTIC...) -> state -> part of a state (N.Y. City, Upstate N.Y.)
+# with the territories (Guam, P.R....) listed after the states but not counted in the US total.
+# Labels that were spelled differently in different years ('N.Y. (Upstate)' and 'Upstate N.Y.') get the same ID, so
+# joining years together is a comparison of integers rather than of strings.
+
+from array import array
+from collections import namedtuple
+
+from column_names import FOOTNOTES
+from lookup_data import geography
+
+Area = namedtuple('Area', 'id code level region state')
+
+# Row ID for labels that aren't in lookup_data.geography
+UNMAPPED = -1
+
+# Areas in the order the table lists them. Regions are followed by their states; states split into parts are followed
+#  by their parts.
+_HIERARCHY = [('USA', []),
+              ('REGION New England', ['CT', 'ME', 'MA', 'NH', 'RI', 'VT']),
+              ('REGION Mid-atlantic', ['NJ', ('NY', ['NY (upstate)', 'NY (City)']), 'PA']),
+              ('REGION Northeast-central', ['IL', 'IN', 'MI', 'OH', 'WI']),
+              ('REGION Northwest-central', ['IA', 'KS', 'MN', 'MO', 'NE', 'ND', 'SD']),
+              ('REGION South-atlantic', ['DE', 'DC', 'FL', 'GA', 'MD', 'NC', 'SC', 'VA', 'WV']),
+              ('REGION Southeast-central', ['AL', 'KY', 'MS', 'TN']),
+              ('REGION Southwest-central', ['AR', 'LA', 'OK', 'TX']),
+              ('REGION Mountain', ['AZ', 'CO', 'ID', 'MT', 'NV', 'NM', 'UT', 'WY']),
+              ('REGION Pacific', ['AK', 'CA', 'HI', 'OR', 'WA']),
+              (None, ['AS', 'MP', 'GU', 'PR', 'VI'])]
+
+
+def _build_areas():
+    areas = []
+
+    def add(code, level, region, state):
+        areas.append(Area(len(areas), code, level, region, state))
+
+    for region, states in _HIERARCHY:
+        if region == 'USA':
+            add('USA', 'country', None, None)
+            continue
+        if region is not None:
+            add(region, 'region', None, None)
+        for state in states:
+            if isinstance(state, tuple):
+                state, parts = state
+            else:
+                parts = []
+            add(state, 'state' if region else 'territory', region, None)
+            for part in parts:
+                add(part, 'substate', region, state)
+    return areas
+
+areas = _build_areas()
+area_by_code = dict((a.code, a) for a in areas)
+
+# Labels that are meant to share a code: the same place, spelled differently in different years
+ALIASES = [set(['N.Y. (Upstate)', 'Upstate N.Y.'])]
+
+
+def find_collisions(mapping=None):
+    """
+    Check a label -> code mapping for codes that more than one label maps to, other than the known ALIASES. Catches
+     typos like 'Ark.' and 'Alaska' both mapping to AK. Reported by batch_parse.py alongside unmapped row labels.
+    :return: {code: sorted list of labels} for every suspicious code
+    :rtype : dict
+    """
+    labels_by_code = {}
+    for label, code in (mapping or geography).iteritems():
+        labels_by_code.setdefault(code, set()).add(label)
+    return dict((code, sorted(labels)) for code, labels in labels_by_code.iteritems()
+                if len(labels) > 1 and labels not in ALIASES)
+
+
+
+def unknown_codes(mapping=None):
+    """
+    Codes in a label -> code mapping that aren't in the hierarchy above. Labels with these codes are treated as
+     unmapped.
+    :rtype : list
+    """
+    return sorted(set((mapping or geography).itervalues()) - set(area_by_code))
+
+# Every known label, precomputed. Labels are also matched after removing footnote symbols and ignoring case;
+#  whatever turns up is remembered here so each distinct label is only worked out once.
+_ids_by_label = dict((label, area_by_code[code].id) for label, code in geography.iteritems() if code in area_by_code)
+_ids_by_cleaned_label = dict((' '.join(label.split()).lower(), i) for label, i in _ids_by_label.iteritems())
+
+
+def geography_id(label):
+    """
+    Integer ID of a row label, or UNMAPPED if it isn't a known reporting area
+    :rtype : int
+    """
+    try:
+        return _ids_by_label[label]
+    except KeyError:
+        cleaned = ' '.join(FOOTNOTES.sub(' ', label).split()).lower()
+        i = _ids_by_label[label] = _ids_by_cleaned_label.get(cleaned, UNMAPPED)
+        return i
+
+
+def geography_ids(labels):
+    """
+    Map a whole file's worth of row labels to IDs at once.
+    :return: (array of IDs lined up with labels, list of labels that couldn't be mapped)
+    :rtype : tuple
+    """
+    ids = array('h', map(geography_id, labels))
+    unmapped = [label for label, i in zip(labels, ids) if i == UNMAPPED] if UNMAPPED in ids else []
+    return ids, unmapped
+
+
+def area(label):
+    """
+    The Area (id, code, level, region, state) for a row label, or None if it isn't a known reporting area
+    """
+    i = geography_id(label)
+    return None if i == UNMAPPED else areas[i]
+
+
+def areas_within(code):
+    """
+    Every area inside the given one: the states (and their parts) of a region, or the parts of a state
+    :rtype : list
+    """
+    return [a for a in areas if code in (a.region, a.state)]
@@ -63,7 +63,7 @@ geography = {'UNITED STATES': 'USA',
              'Miss.': 'MS',
              'Tenn.': 'TN',
              'W.S. CENTRAL': 'REGION Southwest-central',
-             'Ark.': 'AK',
+             'Ark.': 'AR',
              'La.': 'LA',
              'Okla.': 'OK',
              'Tex.': 'TX',
@@ -92,9 +92,8 @@ geography = {'UNITED STATES': 'USA',
 #  malformed tables from 1996-1999 (specifically those that said "this table wasn't published in this time period")-
 #  hence this list may not include every fieldname when examining the very oldest tab files
 
-# This needs to be converted to a dictionary so that the column name can be mapped to metadata, like
-#    (diseasename, time period, type of statistic)
-# That way we can track specific diseases in the database
+# Each of these is mapped to metadata, like (disease name, subtype, type of statistic, time period), by column_names.py
+#  (using disease_names, below). That way we can track specific diseases in the database
 column_metadata = ['AIDS \xa7 cummulative for 1999',
      'AIDS \xa7 cummulative for 2000',
      'AIDS \xa7 cummulative for 2001',
@@ -761,4 +760,119 @@ column_metadata = ['AIDS \xa7 cummulative for 1999',
      'West Nile virus disease \x86 Non-neuroinvasive \xa7 previous 52 weeks median ',
      'West Nile virus disease \xa7 Neuroinvasive cummulative for 2004',
      'West Nile virus disease \xa7 Neuroinvasive cummulative for 2005',
-     'West Nile virus disease \xa7 Non-neuroinvasive \x86 cummulative for 2005']
\ No newline at end of file
+     'West Nile virus disease \xa7 Non-neuroinvasive \x86 cummulative for 2005']
+
+
+# Canonical (disease, subtype) for every spelling of a disease name seen in column_metadata. Keys are the part of the
+#  column name before the statistic, cleaned up by column_names.clean_disease_name(): footnote symbols removed,
+#  whitespace collapsed, and lowercased. Spelling, capitalization and naming changed from year to year
+#  (including "Syphillis"), so this is what lets one disease be followed across all of them.
+disease_names = {
+    'aids': ('AIDS', ''),
+    'chlamydia': ('Chlamydia trachomatis infection', ''),
+    'chlamydia trachomatis infection': ('Chlamydia trachomatis infection', ''),
+    'coccidioidomycosis': ('Coccidioidomycosis', ''),
+    'cryptosporidiosis': ('Cryptosporidiosis', ''),
+    'dengue virus infection, dengue fever': ('Dengue virus infection', 'dengue fever'),
+    'dengue virus infection, dengue hemorrhagic fever': ('Dengue virus infection', 'dengue hemorrhagic fever'),
+    'ehrlichiosis/anaplasmosis, anaplasma phagocytophilum': ('Ehrlichiosis/Anaplasmosis',
+                                                             'Anaplasma phagocytophilum'),
+    'ehrlichiosis/anaplasmosis, ehrlichia chaffeensis': ('Ehrlichiosis/Anaplasmosis', 'Ehrlichia chaffeensis'),
+    'ehrlichiosis/anaplasmosis, undetermined': ('Ehrlichiosis/Anaplasmosis', 'undetermined'),
+    'encephalitis/meningitis west nile': ('West Nile virus disease', 'neuroinvasive'),
+    'escherichia coli o157:h7': ('Shiga toxin-producing E. coli', 'O157:H7'),
+    'escherichia coli o157:h7 netss': ('Shiga toxin-producing E. coli', 'O157:H7, NETSS'),
+    'escherichia coli o157:h7 phlis': ('Shiga toxin-producing E. coli', 'O157:H7, PHLIS'),
+    'escherichia coli shiga toxin positive, serogroup non-0157': ('Shiga toxin-producing E. coli', 'non-O157'),
+    'escherichia coli, enterohemorrhagic, (ehec), 0157:h7': ('Shiga toxin-producing E. coli', 'O157:H7'),
+    'escherichia coli, enterohemorrhagic, (ehec), shiga toxin positive, not serogrouped':
+        ('Shiga toxin-producing E. coli', 'not serogrouped'),
+    'escherichia coli, enterohemorrhagic, (ehec), shiga toxin positive, serogroup non-0157':
+        ('Shiga toxin-producing E. coli', 'non-O157'),
+    'escherichia coli, enterohemorrhagic, o157:h7': ('Shiga toxin-producing E. coli', 'O157:H7'),
+    'escherichia coli, enterohemorrhagic, shiga toxin positive, not serogrouped':
+        ('Shiga toxin-producing E. coli', 'not serogrouped'),
+    'escherichia coli, enterohemorrhagic, shiga toxin positive, serogroup non-0157':
+        ('Shiga toxin-producing E. coli', 'non-O157'),
+    'escherichia coli, shiga toxin positive, not serogrouped': ('Shiga toxin-producing E. coli', 'not serogrouped'),
+    'shiga toxin-producing e. coli(stec)': ('Shiga toxin-producing E. coli', ''),
+    'giardiasis': ('Giardiasis', ''),
+    'gonorrhea': ('Gonorrhea', ''),
+    'haemophilus influenzae, invasive, age < 5 years, non-serotype b': ('Haemophilus influenzae, invasive',
+                                                                        'age <5 years, non-serotype b'),
+    'haemophilus influenzae, invasive, age < 5 years, serotype b': ('Haemophilus influenzae, invasive',
+                                                                    'age <5 years, serotype b'),
+    'haemophilus influenzae, invasive, age < 5 years, unknown serotype': ('Haemophilus influenzae, invasive',
+                                                                          'age <5 years, unknown serotype'),
+    'haemophilus influenzae, invasive, all ages, all serotypes': ('Haemophilus influenzae, invasive',
+                                                                  'all ages, all serotypes'),
+    'hepatitis (viral acute), type a': ('Hepatitis, viral, acute', 'type A'),
+    'hepatitis (viral acute), type b': ('Hepatitis, viral, acute', 'type B'),
+    'hepatitis (viral acute), type c': ('Hepatitis, viral, acute', 'type C'),
+    'hepatitis (viral), type a': ('Hepatitis, viral, acute', 'type A'),
+    'hepatitis (viral), type b': ('Hepatitis, viral, acute', 'type B'),
+    'hepatitis (viral), type c; non-a, non-b': ('Hepatitis, viral, acute', 'type C'),
+    'hepatitis (viral, acute), type a': ('Hepatitis, viral, acute', 'type A'),
+    'hepatitis (viral, acute), type b': ('Hepatitis, viral, acute', 'type B'),
+    'hepatitis (viral, acute), type c': ('Hepatitis, viral, acute', 'type C'),
+    'hepatitis c/na,nb': ('Hepatitis, viral, acute', 'type C'),
+    'legionellosis': ('Legionellosis', ''),
+    'listeriosis': ('Listeriosis', ''),
+    'lyme disease': ('Lyme disease', ''),
+    'malaria': ('Malaria', ''),
+    'measles total': ('Measles', ''),
+    'meningococcal disease': ('Meningococcal disease, invasive', 'all serogroups'),
+    'meningococcal disease, all serogroups': ('Meningococcal disease, invasive', 'all serogroups'),
+    'meningococcal disease, other serogroup': ('Meningococcal disease, invasive', 'other serogroup'),
+    'meningococcal disease, serogroup a, c, y, and w-135': ('Meningococcal disease, invasive',
+                                                            'serogroup A, C, Y, and W-135'),
+    'meningococcal disease, serogroup b': ('Meningococcal disease, invasive', 'serogroup B'),
+    'meningococcal disease, serogroup unknown': ('Meningococcal disease, invasive', 'serogroup unknown'),
+    'meningococcal diseases, invasive, all groups': ('Meningococcal disease, invasive', 'all serogroups'),
+    'meningococcal diseases, invasive, all serogroups': ('Meningococcal disease, invasive', 'all serogroups'),
+    'meningococcal diseases, invasive, serogroup unknown': ('Meningococcal disease, invasive', 'serogroup unknown'),
+    'mumps': ('Mumps', ''),
+    'pertussis': ('Pertussis', ''),
+    'rabies, animal': ('Rabies, animal', ''),
+    # Before 2010, only RMSF was counted; afterwards the wider spotted fever rickettsiosis. Not the same series.
+    'rocky mountain spotted fever': ('Rocky Mountain spotted fever', ''),
+    'spotted fever rickettsiosis (including rmsf) confirmed': ('Spotted fever rickettsiosis', 'confirmed'),
+    'spotted fever rickettsiosis (including rmsf) probable': ('Spotted fever rickettsiosis', 'probable'),
+    'rubella': ('Rubella', ''),
+    'rubella congenital': ('Rubella', 'congenital'),
+    'salmonellosis': ('Salmonellosis', ''),
+    'salmonellosis, netss': ('Salmonellosis', 'NETSS'),
+    'salmonellosis, phlis': ('Salmonellosis', 'PHLIS'),
+    'shigellosis': ('Shigellosis', ''),
+    'shigellosis netss': ('Shigellosis', 'NETSS'),
+    'shigellosis phlis': ('Shigellosis', 'PHLIS'),
+    'streptococcal disease, invasive, group a': ('Streptococcal disease, invasive, group A', ''),
+    'streptococcus pneumoniae, drug resistant, invasive': ('Streptococcus pneumoniae, invasive disease',
+                                                           'drug resistant, all ages'),
+    'streptococcus pneumoniae, drug resistant, invasive, all ages': ('Streptococcus pneumoniae, invasive disease',
+                                                                     'drug resistant, all ages'),
+    'streptococcus pneumoniae, invasive disease, age <5 years': ('Streptococcus pneumoniae, invasive disease',
+                                                                 'age <5 years'),
+    'streptococcus pneumoniae, invasive disease, all ages': ('Streptococcus pneumoniae, invasive disease',
+                                                             'all ages'),
+    'streptococcus pneumoniae, invasive disease, age < 5 years': ('Streptococcus pneumoniae, invasive disease',
+                                                                  'age <5 years'),
+    'streptococcus pneumoniae, invasive disease, drug resistant, age <5 years':
+        ('Streptococcus pneumoniae, invasive disease', 'drug resistant, age <5 years'),
+    'streptococcus pneumoniae, invasive disease, drug resistant, all ages':
+        ('Streptococcus pneumoniae, invasive disease', 'drug resistant, all ages'),
+    'streptococcus pneumoniae, invasive disease, nondrug resistant, age <5 years':
+        ('Streptococcus pneumoniae, invasive disease', 'nondrug resistant, age <5 years'),
+    'streptococcus pneumoniae, invasive, age < 5 years': ('Streptococcus pneumoniae, invasive disease',
+                                                          'age <5 years'),
+    'streptococcus pneumoniae, invasive, drug resistant, all ages': ('Streptococcus pneumoniae, invasive disease',
+                                                                     'drug resistant, all ages'),
+    'syphilis (congenital)': ('Syphilis', 'congenital'),
+    'syphilis (primary and secondary)': ('Syphilis', 'primary and secondary'),
+    'syphillis, primary & secondary': ('Syphilis', 'primary and secondary'),
+    'tuberculosis': ('Tuberculosis', ''),
+    'typhoid fever': ('Typhoid fever', ''),
+    'varicella (chicken pox)': ('Varicella', ''),
+    'varicella (chickenpox)': ('Varicella', ''),
+    'west nile virus disease neuroinvasive': ('West Nile virus disease', 'neuroinvasive'),
+    'west nile virus disease non-neuroinvasive': ('West Nile virus disease', 'non-neuroinvasive')}
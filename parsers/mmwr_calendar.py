@@ -0,0 +1,86 @@
+__author__ = 'Andrew Boughton and the A2 Hack for Change team'
+# The MMWR (epidemiological) week calendar, which every table in the archive is organized by:
+#   - weeks run Sunday to Saturday, and are named for the Saturday that ends them
+#   - week 1 of an MMWR year is the week containing January 4 (so it can start as early as December 29)
+#   - a year has 52 weeks, or 53 when the next year's week 1 starts a whole week later (1992, 1997, 2003, 2008, 2014...)
+# Used by the crawler and by get_tables_timerange to list exactly the weeks that exist, so no request is spent on a week
+# 53 that never happened and no real week 53 is skipped.
+#   week_range(2007, 2009, 50, 2) -> [(2007, 50, date(2007, 12, 15)), ..., (2008, 53, date(2009, 1, 3)), ...]
+
+import datetime
+
+# Years precomputed when the module is imported. Anything outside this is worked out (and remembered) when needed.
+FIRST_YEAR = 1980
+LAST_YEAR = 2050
+
+_ONE_WEEK = datetime.timedelta(days=7)
+_year_starts = {}
+
+
+def year_start(year):
+    """
+    The Sunday that starts week 1 of an MMWR year
+    :rtype : datetime.date
+    """
+    try:
+        return _year_starts[year]
+    except KeyError:
+        jan4 = datetime.date(year, 1, 4)
+        start = _year_starts[year] = jan4 - datetime.timedelta(days=(jan4.weekday() + 1) % 7)
+        return start
+
+
+def weeks_in_year(year):
+    """
+    52 or 53
+    :rtype : int
+    """
+    return (year_start(year + 1) - year_start(year)).days // 7
+
+
+def week_ending(year, week):
+    """
+    The Saturday that ends a given MMWR week (the date the published tables are labelled with)
+    :rtype : datetime.date
+    """
+    return year_start(year) + datetime.timedelta(days=7 * week - 1)
+
+
+def mmwr_week(date):
+    """
+    The (MMWR year, MMWR week) a date falls in
+    :rtype : tuple
+    """
+    year = date.year + 1
+    while date < year_start(year):
+        year -= 1
+    return year, (date - year_start(year)).days // 7 + 1
+
+
+def long_years(startyear, endyear):
+    """
+    The years from startyear to endyear (inclusive) that have a week 53
+    :rtype : list
+    """
+    return [year for year in xrange(startyear, endyear + 1) if weeks_in_year(year) == 53]
+
+
+def week_range(startyear, endyear, startweek=1, endweek=53):
+    """
+    Every MMWR week from (startyear, startweek) to (endyear, endweek), inclusive and in order, as
+     (year, week, week ending date) tuples. Weeks that don't exist (a week 53 in a 52-week year) are left out.
+    :rtype : list
+    """
+    weeks = []
+    for year in xrange(startyear, endyear + 1):
+        first = startweek if year == startyear else 1
+        last = min(endweek if year == endyear else 53, weeks_in_year(year))
+        ending = week_ending(year, first)
+        for week in xrange(first, last + 1):
+            weeks.append((year, week, ending))
+            ending += _ONE_WEEK
+    return weeks
+
+
+for _year in xrange(FIRST_YEAR, LAST_YEAR + 2):
+    year_start(_year)
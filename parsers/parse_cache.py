@@ -0,0 +1,133 @@
+__author__ = 'Andrew Boughton and the A2 Hack for Change team'
+# Keeps parsed tab files on disk (as pickles) so that the same files don't have to be re-read and re-parsed every
+# time a script runs. Each entry remembers the size, modification time and sha1 of the file it came from:
+#   - size and mtime unchanged: the cached copy is used without even opening the tab file
+#   - size or mtime changed: the file is hashed, and only re-parsed if its contents really are different
+# Least recently used entries are deleted once the cache grows past its size cap.
+# Compressed tab files are checked the same way, going by the compressed file (see compressed_files.py). For files in a
+# year bundle, that means the whole bundle: adding a file to it marks that year's entries to be re-checked.
+
+import cPickle
+import collections
+import hashlib
+import os
+
+from compressed_files import find_tabfile
+from parse_table2_tabfiles import ColumnarTabFileParser
+from persistence import atomic_file
+
+# Bump this whenever the parsed objects change shape, so old cache entries aren't mistaken for current ones
+CACHE_FORMAT = 4
+
+
+class ParseCache(object):
+    def __init__(self, directory, max_bytes=1024 * 1024 * 1024, parser_class=ColumnarTabFileParser):
+        """
+        :param directory: Folder to keep the cache in (created if needed)
+        :param max_bytes: Size cap for the whole cache folder
+        :param parser_class: TabFileParser subclass used to parse files that aren't cached yet, and the default for
+            get and put. Entries are kept separately for each parser class.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.parser_class = parser_class
+        self.stats = collections.Counter()
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # Least recently used first, going by when each entry was last read or written
+        existing = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.parsed')]
+        existing.sort(key=os.path.getmtime)
+        self._entries = collections.OrderedDict((path, os.path.getsize(path)) for path in existing)
+        self._size = sum(self._entries.itervalues())
+        self._evict()
+
+    def _path(self, fullfilename, filename, parser_class):
+        # A year bundle holds many files, so the name of the file is part of the key as well as where it's stored
+        key = '{0}:{1}.{2}:{3}:{4}'.format(CACHE_FORMAT, parser_class.__module__, parser_class.__name__,
+                                           os.path.abspath(fullfilename), filename)
+        return os.path.join(self.directory, hashlib.sha1(key).hexdigest() + '.parsed')
+
+    def get(self, filename, filepath='.', parser_class=None):
+        """
+        Return the cached parse of a file, or None if it isn't cached or the file has changed since
+        :param parser_class: Parser class the file was parsed with (defaults to the cache's own)
+        """
+        parser_class = parser_class or self.parser_class
+        try:
+            fullfilename = find_tabfile(filename, filepath)[0]
+        except IOError:
+            self.stats['misses'] += 1
+            return None
+        path = self._path(fullfilename, filename, parser_class)
+        if path not in self._entries:
+            self.stats['misses'] += 1
+            return None
+
+        try:
+            stat = os.stat(fullfilename)
+            with open(path, 'rb') as f:
+                # Entries are two pickles back to back: a small header describing the source file, then the parsed
+                # object. Only unpickle the second one if the first says it's still valid.
+                size, mtime, sha1 = cPickle.load(f)
+                if (size, mtime) != (stat.st_size, stat.st_mtime):
+                    if sha1 != self.hash_file(fullfilename):
+                        self.stats['stale'] += 1
+                        return None
+                parsed = cPickle.load(f)
+        except (IOError, OSError, EOFError, cPickle.UnpicklingError):
+            self.stats['misses'] += 1
+            return None
+
+        if (size, mtime) != (stat.st_size, stat.st_mtime):
+            # Touched but not changed- update the stored size/mtime so next time the quick check is enough
+            self.put(filename, filepath, parsed, parser_class)
+        else:
+            os.utime(path, None)
+            self._entries[path] = self._entries.pop(path)
+        self.stats['hits'] += 1
+        return parsed
+
+    def put(self, filename, filepath, parsed, parser_class=None):
+        """
+        Store the parse of a file
+        :param parser_class: Parser class it was parsed with (defaults to the cache's own)
+        """
+        fullfilename = find_tabfile(filename, filepath)[0]
+        path = self._path(fullfilename, filename, parser_class or self.parser_class)
+        stat = os.stat(fullfilename)
+        header = (stat.st_size, stat.st_mtime, self.hash_file(fullfilename))
+
+        with atomic_file(path) as f:
+            cPickle.dump(header, f, cPickle.HIGHEST_PROTOCOL)
+            cPickle.dump(parsed, f, cPickle.HIGHEST_PROTOCOL)
+
+        self._size -= self._entries.pop(path, 0)
+        self._entries[path] = os.path.getsize(path)
+        self._size += self._entries[path]
+        self._evict()
+
+    def load(self, filename, filepath='.'):
+        """
+        Return the parse of a file: from the cache if possible, otherwise parsed now (and cached for next time)
+        """
+        parsed = self.get(filename, filepath)
+        if parsed is None:
+            parsed = self.parser_class(filename, filepath=filepath)
+            self.put(filename, filepath, parsed)
+        return parsed
+
+    def hash_file(self, fullfilename):
+        with open(fullfilename, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._entries:
+            path, size = self._entries.popitem(last=False)
+            self._size -= size
+            self.stats['evicted'] += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
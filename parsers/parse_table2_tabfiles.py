@@ -1,6 +1,12 @@
 #! /usr/bin/env python
-import os, re, subprocess, glob, pprint
+import os, re, subprocess, glob, fnmatch, pprint, datetime
 from lookup_data import month_lookup
+from column_names import normalize_column_name
+from columnar_table import ColumnarTable, row_geography, row_names, typed_cell
+from compressed_files import COMPRESSORS, bundled_filenames, read_tabfile
+from geography import UNMAPPED, geography_id
+from mmwr_calendar import mmwr_week, week_range
+from search_index import load_index
 
 __author__ = 'Andrew Boughton and the A2 Hack for Change team'
 # Parse CDC MMWR data- the parser in this file is currently aimed at the format and contents of "table 2"
@@ -11,6 +17,55 @@ __author__ = 'Andrew Boughton and the A2 Hack for Change team'
 # These are probably the symbols used in the publication to indicate footnotes
 
 
+#########
+# Header and filename metadata. Patterns are compiled once, here, rather than for every file.
+#########
+# The date is the first "Month day, year" in the header line, e.g. "... for week ending March 3, 2007 (9th Week)"
+_HEADER_DATE = re.compile(r'({0})\s(\d+),\s(\d+)'.format('|'.join(month_lookup)))
+# Standard tab file name: {year}_wk{week}_table{name}.tab
+_FILENAME = re.compile(r'^(\d+)_wk(\d+)_table(\w+).tab$')
+
+
+def parse_header_date(header):
+    """
+    The week ending date in a file's header line, as a datetime.date
+    :rtype : datetime.date
+    """
+    month, day, year = _HEADER_DATE.search(header).groups()
+    return datetime.date(int(year), month_lookup[month] + 1, int(day))
+
+
+def parse_filename(filename):
+    """
+    MMWR year, MMWR week and table name from a standard tab file name, e.g. '2007_wk09_table2H.tab' -> (2007, 9, '2H')
+    :rtype : tuple
+    """
+    year, week, table_name = _FILENAME.match(filename).groups()
+    return int(year), int(week), table_name
+
+
+def extract_metadata(headers, filenames):
+    """
+    Date, MMWR year and week, and table name for a whole list of files at once, given their header lines and names.
+    Every table published in the same week has the same header, so each distinct header is only parsed once.
+    :param headers: Header line of each file (the second line)
+    :param filenames: Standard tab file name of each file, lined up with headers
+    :rtype : list
+    :return: List of metadata dicts, as TabFileParser.metadata
+    """
+    dates = {}
+    metadata = []
+    for header, filename in zip(headers, filenames):
+        if header not in dates:
+            dates[header] = parse_header_date(header)
+        year, week, table_name = parse_filename(filename)
+        metadata.append({'date': dates[header],
+                         'year_and_week': (year, week),
+                         'table_name': table_name,
+                         'filename': filename})
+    return metadata
+
+
 #########
 # Parser object- can be subclassed to modify treatment of specific sections whose format is different, as desired
 # (Most common use case: these files share common headers and footers. Can create a subclass that changes only the
@@ -25,7 +80,8 @@ class TabFileParser(object):
          for examination via attributes
             .sections[sectionnames] , .parsed[columnnames][rownames], .fileinfo[filename or date]
         :param filename:
-        :param filepath: Manually specify if the filename to be opened is not in the current directory.
+        :param filepath: Manually specify if the filename to be opened is not in the current directory. Can also be a
+            TabArchive, to read the file out of a packed archive instead.
         """
         list_of_lines_in_file = self.load_file(filename, filepath)
 
@@ -33,30 +89,29 @@ class TabFileParser(object):
         self.sections = self.postprocess_sections(self.sections)
 
         self.table_data = self.parse_tabledata(self.sections)
+        self.geography_rows, self.unmapped_geography = self.parse_geography(self.table_data)
 
         self.metadata = self.get_metadata(filename, self.sections)
 
     def load_file(self, filename, filepath):
         """
-        Load a file and return a list (1 string per line in file)
+        Load a file and return a list (1 string per line in file). The file can also be stored compressed, as
+        filename.gz, filename.bz2, or in a per-year zip bundle (see compressed_files.py).
         :rtype : list
+        :param filepath: Folder the file is in, or an open TabArchive (see tab_archive.py) to read it from
         """
-        fullfilename = os.path.join(filepath, filename)
-        with open(fullfilename, 'rU') as f:
-            list_of_lines_in_file = f.read().splitlines()
+        if not isinstance(filepath, basestring):
+            return filepath.readlines(filename)
+        list_of_lines_in_file = read_tabfile(filename, filepath).splitlines()
         return list_of_lines_in_file
 
     def get_metadata(self, filename, sections):
         """
-        Get metadata about the file and make it available
+        Get metadata about the file and make it available: date (a datetime.date), year_and_week (MMWR year and week,
+        as ints), table_name and filename
         :rtype : dict
         """
-        filename_sections = re.findall(r'^(\d+)_wk(\d+)_table(\w+).tab$', filename)[0]
-        metadata = {'date': self.parse_header(sections['header']),
-                    'year_and_week': filename_sections[0:2],
-                    'table_name': filename_sections[2],
-                    'filename': filename}
-        return metadata
+        return extract_metadata([sections['header']], [filename])[0]
 
     def get_sections(self, list_of_lines_in_file):
         """
@@ -117,40 +172,27 @@ class TabFileParser(object):
 
     def parse_header(self, header):
         """
-         Gets the date the file was uploaded, based on regex. The date is usually in the first non-blank line of
+         Gets the date the file was uploaded, as a datetime.date. The date is usually in the first non-blank line of
          the file, so this function won't do anything especially exciting if given any other string of text
         :param header:
         """
-        date_string = re.findall(
-            r'(?:January|February|March|April|May|June|July|August|September|October|November|December)\s\d+,\s\d+',
-            header)[0]
-        # Had trouble capturing the data fields directly from first regex- got parenthesis errors. So, just use
-        #  a second regex.
-
-        # Interesting, the second regex will probably capture most of the dates in the files by itself. But it's
-        #  probably worth the extra effort of the date-specific regex to be sure.
-        date_tuple = re.findall(r'(\w+)\s(\d+),\s(\d+)', date_string)[0]
-        return date_tuple
-
-    def parse_columnnames(self):
-        """
-        Return dict with metadata on disease name, duration, and other relevant info
+        return parse_header_date(header)
 
-        The original idea was to do this manually, but then I realized (using head -2 *table2*) that the field names
-           and file contents were laid out very very similarly in every file. So someone can generate a lookup
-           table that manually replaces each instance of "disease cumulative 52 weeks median" with separately assigned
-            metadata for that column. (disease, cumulative, 52 weeks, median)
-
-        It would mean evaluating maybe 10-20 files with a few headings each- would be faster and way more reliable than
-        trying to pick out the disease names and field data manually.
+    def parse_columnnames(self, column_names=None):
         """
+        Return dict with metadata on disease name, subtype, statistic and time period for each column, ie
+            d[columnname] = ColumnKey(disease, subtype, statistic, period)
+        Columns that don't hold data (Reporting Area) map to None.
 
-        # First step: define variablity in column headers to understand field types
-        # Second step: define list of known/accepted disease names
-        # TODO: Never got around to implementing this. See notes for a better way.
-        # Can use data from http://wwwn.cdc.gov/nndss/script/conditionlist.aspx?type=0&yr=2013
-        # And hey, disease lists for previous years can be viewed by changing year URL parameter!!
-        return
+        Works from a lookup table (column_names.py, and disease_names in lookup_data) that covers every column header
+         seen in the 2006-2013 files, so the same disease has the same key however its header was spelled that year.
+         Looking a column up is a single dict access.
+        :rtype : dict
+        :param column_names: Column names to describe (defaults to the column names of this file)
+        """
+        if column_names is None:
+            column_names = self.sections['column_names']
+        return dict((column_name, normalize_column_name(column_name)) for column_name in column_names)
 
     def parse_tabledata(self, sections):
         """
@@ -178,6 +220,36 @@ class TabFileParser(object):
 
         return table_data
 
+    def parse_geography(self, table_data):
+        """
+        Map the row labels of the table to geography IDs (see geography.py), so the same place can be found in any year
+        however its label was spelled.
+        :return: ({geography id: row label in this file}, list of row labels that aren't known reporting areas)
+        :rtype : tuple
+        """
+        ids, unmapped = row_geography(table_data)
+        return dict((i, row_name) for i, row_name in zip(ids, row_names(table_data)) if i != UNMAPPED), unmapped
+
+    def find_row(self, row_name):
+        """
+        Label this file uses for the same place as row_name (which may be spelled the way another year spelled it)
+        """
+        return self.geography_rows.get(geography_id(row_name), row_name)
+
+    def find_column(self, column_name):
+        """
+        Name this file uses for the same column as column_name (which may be spelled the way another year spelled it),
+         matched by ColumnKey (see column_names.py)
+        """
+        if column_name in self.table_data:
+            return column_name
+        key = normalize_column_name(column_name)
+        if key is not None:
+            for name in self.table_data:
+                if normalize_column_name(name) == key:
+                    return name
+        return column_name
+
     def parse_footnotes(self, footnotechunk):
         """Creates a dictionary to replace footnote codes with footnote text when seen later
         :param footnotechunk:
@@ -192,6 +264,104 @@ class TabFileParser(object):
         return dict(line_tuples)
 
 
+class StreamingTabFileParser(TabFileParser):
+    """
+    Streaming variant of TabFileParser. Reads line by line from any file-like object that can be iterated over (an open
+    file, an HTTP response, a gzip member...) and hands back one data row at a time, so memory use doesn't grow with the
+    size of the file: no more than one row of raw text is held at once.
+
+    Header, metadata and column names are available as soon as the object is created (and in .sections, as for
+    TabFileParser, minus the data and footnotes). Iterating over it yields (row name, list of values) tuples, with the
+    values lined up with .column_names. Footnotes are collected into .footnotes as the end of the file is reached.
+
+        parsed = StreamingTabFileParser(open('2013_wk09_table2H.tab', 'rU'), filename='2013_wk09_table2H.tab')
+        for row_name, values in parsed:
+            ...
+    """
+
+    def __init__(self, fileobj, filename=None):
+        """
+        Reads just far enough into the file to get the header and the column names.
+        :param fileobj: File-like object to read from. Needs to be open when iteration starts.
+        :param filename: Standard tab file name ({year}_wk{week}_table{name}.tab). Used for metadata, if provided;
+            without it the MMWR week is worked out from the header date, and table_name and filename are None.
+        """
+        self._lines = (line.rstrip('\r\n') for line in fileobj)
+        self.footnotes = []
+
+        # First 3 rows of datafile are blank + date header + blank.
+        next(self._lines)
+        self.header = next(self._lines)
+        next(self._lines)
+
+        # The column section begins with a statement that the column section is beginning. Skip that line.
+        self.column_names = list(self._read_section())[1:]
+        self.sections = {'header': self.header, 'column_names': self.column_names}
+
+        if filename:
+            self.metadata = self.get_metadata(filename, self.sections)
+        else:
+            date = self.parse_header(self.header)
+            self.metadata = {'date': date, 'year_and_week': mmwr_week(date), 'table_name': None, 'filename': None}
+
+    def _read_section(self):
+        """
+        Yield lines until a blank line (or the end of the file) is reached
+        """
+        for line in self._lines:
+            if not line:
+                return
+            yield line
+
+    def iter_sections(self):
+        """
+        Yield (section name, line) pairs for the rest of the file: every data line, then every footnote
+        """
+        # Data section begins with notification that data is beginning, and the word "test". Skip those two.
+        for i, line in enumerate(self._read_section()):
+            if i >= 2:
+                yield 'table_data', line
+        for line in self._read_section():
+            self.footnotes.append(line)
+            yield 'footnotes', line
+
+    def parse_columnnames(self, column_names=None):
+        return super(StreamingTabFileParser, self).parse_columnnames(
+            self.column_names if column_names is None else column_names)
+
+    def __iter__(self):
+        ncolumns = len(self.column_names)
+        for section, line in self.iter_sections():
+            if section == 'table_data':
+                # There are a bunch of blank columns at the end of every row, so don't keep more than we have names for
+                row_values = line.split('\t', ncolumns)[:ncolumns]
+                yield row_values[0], row_values
+
+
+class ColumnarTabFileParser(TabFileParser):
+    """
+    Same as TabFileParser, but .table_data is a ColumnarTable: arrays of counts and footnote codes instead of a dict of
+    strings per column. Uses a fraction of the memory, so a whole archive of parsed files can be kept in RAM at once.
+    .table_data[columnname][rowname] still works (see ColumnarTable for the details), so this can be passed to
+    create_timeseries and friends as-is.
+
+    The raw data lines are thrown away once they've been parsed; the other sections are kept.
+    """
+
+    def __init__(self, filename, filepath="."):
+        super(ColumnarTabFileParser, self).__init__(filename, filepath)
+        del self.sections['table_data']
+
+    def parse_tabledata(self, sections):
+        """
+        Produce a ColumnarTable with the parsed data
+        :rtype : ColumnarTable
+        """
+        column_names = sections['column_names']
+        rows = ((values[0], values) for values in (row.split('\t') for row in sections['table_data']))
+        return ColumnarTable.from_rows(column_names, rows)
+
+
 ########
 # Utility functions for parsing collections of files:
 # Provide several different ways of getting a list of files
@@ -223,8 +393,9 @@ def get_filenames_from_grep(searchterm, searchpath='*'):
     """
     Allow the user to perform case-insensitive search and produce a list of files matching the query strings.
     Is equivalent to running the command line query:
-        grep -il searchterm search_path
-    And therefore will be totally useless in Windows.
+        zgrep -il searchterm search_path
+    And therefore will be totally useless in Windows. zgrep also looks inside .gz files (and gives back the plain
+    file name), but bz2 files and year bundles aren't searched.
 
     Prints error and returns None if the query fails for any reason, including no results or malformed pathname.
     :rtype : list
@@ -233,7 +404,7 @@ def get_filenames_from_grep(searchterm, searchpath='*'):
     """
     try:
         search_results = subprocess.check_output(
-            'grep -il {0} {1}'.format(searchterm, searchpath),
+            'zgrep -il {0} {1}'.format(searchterm, searchpath),
             shell=True,
             stderr=subprocess.STDOUT)
     except subprocess.CalledProcessError as e:
@@ -242,25 +413,63 @@ def get_filenames_from_grep(searchterm, searchpath='*'):
             e.returncode, e.output)
         return None
 
-    return [os.path.split(line)[1] for line in search_results.splitlines()]
+    return [_plain_name(os.path.split(line)[1]) for line in search_results.splitlines()]
+
+
+def get_filenames_from_index(searchterm, index_filename='search_index.pickle'):
+    """
+    Like get_filenames_from_grep, but looks the search term up in a FilenameIndex (see search_index.py) instead of
+    reading every file. Finds the files whose column or row headings contain every word of the search term, ignoring
+    case, spelling changes between years and footnote symbols. The index is loaded once and kept in memory.
+
+    Only as complete as the index, so keep the index up to date as files are downloaded (FilenameIndex.update).
+    :rtype : list
+    :param searchterm: e.g. 'Syphilis, primary & secondary'
+    :param index_filename: File the FilenameIndex was saved in
+    """
+    return load_index(index_filename).search(searchterm)
+
+
+def _plain_name(filename):
+    """
+    Tab file name without any compression suffix
+    """
+    for suffix, opener in COMPRESSORS.itervalues():
+        if filename.endswith(suffix):
+            return filename[:-len(suffix)]
+    return filename
 
 
 def get_filenames_in_directory(directory_name, pattern='*.tab'):
     """
     Gets the filename of every file in a specified directory, according to a specified pattern
     (by default restricts it to those with .tab extension)
+    Compressed files (filename.gz, filename.bz2 and per-year zip bundles) are included, under their plain names, so
+    they can be opened with TabFileParser like any other.
     :rtype : list
     :param directory_name: The directory to search for files in
     :param pattern: The pattern of filename to match (defaults to *.tab)
     """
     pattern_in_path = os.path.join(directory_name, pattern)
-    return [os.path.split(line)[1] for line in glob.glob(pattern_in_path)]
+    filenames = [os.path.split(line)[1] for line in glob.glob(pattern_in_path)]
+
+    # A file could be stored more than one way; list it once
+    seen = set(filenames)
+    compressed = [_plain_name(os.path.split(line)[1])
+                  for suffix, opener in COMPRESSORS.itervalues() for line in glob.glob(pattern_in_path + suffix)]
+    for filename in compressed + fnmatch.filter(bundled_filenames(directory_name), pattern):
+        if filename not in seen:
+            seen.add(filename)
+            filenames.append(filename)
+    return filenames
 
 
 def get_tables_timerange(startyear=1996, endyear=2013, startweek=1, endweek=52, tablename="2J"):
     """
-    Returns all files from a specified table in a specified timerange. Does not perform a sanity check to ensure that
-    the chosen table exists over the entire time range, so be careful- this could generate filenames that don't exist
+    Returns all files from a specified table in a specified timerange. Weeks come from the MMWR calendar (see
+    mmwr_calendar.py), so week 53 is included in exactly the years that have one. Does not perform a sanity check to
+    ensure that the chosen table exists over the entire time range, so be careful- this could generate filenames that
+    don't exist
     :rtype : list
     :param startyear:
     :param endyear:
@@ -268,48 +477,41 @@ def get_tables_timerange(startyear=1996, endyear=2013, startweek=1, endweek=52,
     :param endweek:
     :param tablename:
     """
-    filenames = []
-
-    years = xrange(startyear, endyear + 1, 1)
-
-    for year in years:
-        # Figure out what the list of weeks in that year is (based on how many years we're crawling)
-        if year != endyear:
-            # Manually checked all years from 2006-2013 and found that only 2008 had 53 weeks
-            lastweek = (52 if year != 2008 else 53)
-            if year == startyear:
-                weeks = xrange(startweek, lastweek + 1)
-            else:
-                weeks = xrange(1, lastweek + 1)
-        else:
-            if startyear == endyear:
-                weeks = xrange(startweek, endweek + 1)
-            else:
-                weeks = xrange(1, endweek + 1)
-        for w in weeks:
-            filenames.append(
-                '{0}_wk{1:02}_table{2}.tab'.format(year, w, tablename))
-    return filenames
+    return ['{0}_wk{1:02}_table{2}.tab'.format(year, w, tablename)
+            for year, w, week_ending in week_range(startyear, endyear, startweek, endweek)]
 
 
 #######
 # Functions to parse data and produce a specific time series
 #######
-def create_timeseries(list_of_parsed_objects, column_name, row_name, empty_cell_default=''):
+def create_timeseries(list_of_parsed_objects, column_name, row_name, empty_cell_default='', numeric=False):
     """
     Gets a single datapoint (where row and column intersect) for each week in the dataset passed in
     If the column name isn't present in that file, don't include in series. If just the row name isn't present,
-    include it in the series with value= empty_cell_default
+    include it in the series with value= empty_cell_default. Row names are matched by place, not spelling: 'Upstate
+    N.Y.' also finds the rows labelled 'N.Y. (Upstate)'. Column names are matched by what they hold (see
+    column_names.py), so a disease is followed across years whose headers spelled it differently.
+
+    With numeric=True, each datapoint is (date, count, code) instead: count is an int (or None if the cell holds
+    no number- see code, one of the cell codes from columnar_table, for why). Objects from ColumnarTabFileParser
+    already hold typed values, so nothing is re-parsed; with plain TabFileParser objects, each cell is converted here.
     :param list_of_parsed_objects:
     :param column_name:
     :param row_name:
     :param empty_cell_default:
+    :param numeric: Return typed values instead of the cell text
     """
     # TODO: This automatically ignores any files that don't contain the column name- perhaps we should indicate the
     # name of the source data file to avoid confusion? (...or is that unnecessary?)
+    columns = [(week_data, week_data.find_column(column_name)) for week_data in list_of_parsed_objects]
+    columns = [(week_data, column) for week_data, column in columns if column in week_data.table_data]
+    if numeric:
+        return [(week_data.metadata['date'],) + typed_cell(week_data.table_data, column, week_data.find_row(row_name))
+                for week_data, column in columns]
+
     visit_scenic_oregon = [(week_data.metadata['date'],
-                            week_data.table_data[column_name].get(row_name, empty_cell_default))
-                           for week_data in list_of_parsed_objects if column_name in week_data.table_data]
+                            week_data.table_data[column].get(week_data.find_row(row_name), empty_cell_default))
+                           for week_data, column in columns]
     return visit_scenic_oregon
 
 
@@ -325,16 +527,28 @@ if __name__ == "__main__":
     #   So for performance and technical reasons, get_filenames_from_file() is recommended over _from_grep()
     #filename_list = get_filenames_from_file('syphilis_datafilenames.txt')
     #filename_list = get_filenames_from_grep(searchterm='python', searchpath='*')
+    #filename_list = get_filenames_from_index('Syphilis, primary & secondary', index_filename='../search_index.pickle')
     #filename_list = get_tables_timerange(startyear=2013,endyear=2013, startweek=1, endweek=21)
 
     if filename_list:
         # For each file read, creates a python object with many attributes (raw and parsed data).
         # Output is a list of objects.
         parsed_data = [TabFileParser(f, filepath='../tabdatafiles') for f in filename_list]
+        # To keep the whole archive in memory at once, use the compact array-backed version instead:
+        #parsed_data = [ColumnarTabFileParser(f, filepath='../tabdatafiles') for f in filename_list]
         time_series = create_timeseries(parsed_data,
                                         'Syphillis, primary & secondary current week',
                                         'Oreg.',
                                         empty_cell_default='N')
         pprint.pprint(time_series)
+
+        # Once the archive has been loaded into SQLite (see sqlite_store.py), the same series is an index lookup:
+        #from sqlite_store import connect, query_timeseries
+        #pprint.pprint(query_timeseries(connect('../mmwr.sqlite'), 'Syphilis, primary and secondary', 'Oreg.'))
+
+        # To go through a file one row at a time without holding the whole thing in memory:
+        #with open(os.path.join('../tabdatafiles', filename_list[0]), 'rU') as f:
+        #    for row_name, values in StreamingTabFileParser(f, filename=filename_list[0]):
+        #        print row_name, values
     else:
         print "No file names matched the specified query; no files opened"
@@ -0,0 +1,75 @@
+__author__ = 'Andrew Boughton and the A2 Hack for Change team'
+# Saving things to disk safely, for the caches, indexes and archives that are kept between runs:
+#   with atomic_file('../search_index.pickle') as f:
+#       cPickle.dump(index, f)
+# The data goes to a temporary .part file, which is only renamed into place once it's complete, so an interrupted
+# write never leaves a truncated file behind: anyone reading sees either the old file or the new one.
+#
+# PickledIndex is the base for the indexes over the archive that are kept in one pickle and brought up to date a few
+# files at a time (FieldCatalog, FilenameIndex): loading and saving, and parsing only the files not seen yet.
+
+import cPickle
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_file(path, opener=open):
+    """
+    Open path for writing, by way of a temporary file that is renamed to path when the with block finishes. If the
+     block raises, path is left as it was.
+    :param opener: Function to open the temporary file with, e.g. gzip.open (see compressed_files.COMPRESSORS)
+    """
+    part = path + '.part'
+    f = opener(part, 'wb')
+    try:
+        yield f
+    finally:
+        f.close()
+    os.rename(part, path)
+
+
+class PickledIndex(object):
+    """
+    Base for an index that is saved as a pickle and kept up to date incrementally. Subclasses set up their empty
+     contents before calling PickledIndex.__init__, list the attributes that get saved in `fields`, and say which files
+     they already hold with __contains__.
+    """
+    fields = ()
+
+    def __init__(self, filename):
+        """
+        :param filename: File the index is kept in. Loaded if it already exists.
+        """
+        self.filename = filename
+        if os.path.exists(filename):
+            with open(filename, 'rb') as f:
+                self.load_state(cPickle.load(f))
+
+    def state(self):
+        return tuple(getattr(self, name) for name in self.fields)
+
+    def load_state(self, state):
+        for name, value in zip(self.fields, state):
+            setattr(self, name, value)
+
+    def save(self):
+        with atomic_file(self.filename) as f:
+            cPickle.dump(self.state(), f, cPickle.HIGHEST_PROTOCOL)
+
+    def __contains__(self, filename):
+        raise NotImplementedError
+
+    def parse_unseen(self, filename_list, filepath='.', processes=None, cache=None):
+        """
+        Parse just the files in filename_list that aren't in the index yet (see batch_parse.parse_files)
+        :return: (list of parsed objects, list of (filename, error) for files that couldn't be parsed)
+        :rtype : tuple
+        """
+        # Imported here rather than at the top: batch_parse imports parse_table2_tabfiles, which imports search_index
+        from batch_parse import parse_files
+
+        unseen = [f for f in filename_list if f not in self]
+        if not unseen:
+            return [], []
+        return parse_files(unseen, filepath=filepath, processes=processes, cache=cache, progress=len(unseen) > 100)
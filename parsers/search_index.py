@@ -0,0 +1,131 @@
+__author__ = 'Andrew Boughton and the A2 Hack for Change team'
+# Which files mention a disease or a place? An inverted index from words to files, kept on disk, answers that without
+# grepping 8k files (or keeping lists like syphilis_datafilenames.txt up to date by hand):
+#   index = FilenameIndex('../search_index.pickle')
+#   index.update(get_filenames_in_directory('../tabdatafiles'), filepath='../tabdatafiles')   # only parses new files
+#   index.save()
+#   index.search('Syphilis, primary & secondary')
+# Words come from the column and row headings of each file. Headings are also indexed under their canonical names
+# (see column_names.py and geography.py), so 'syphilis' finds the years that spelled it "Syphillis", and 'NY' finds
+# 'N.Y. City'. Files can be added as they are loaded into a database, too: see sqlite_store.ingest_parsed.
+
+import os
+import re
+
+from column_names import FOOTNOTES, normalize_column_name, series_name
+from columnar_table import row_names
+from geography import area
+from persistence import PickledIndex
+
+_WORDS = re.compile(r'[a-z0-9]+')
+
+# Indexes already loaded by get_filenames_from_index, by filename: (modification time, index)
+_loaded = {}
+
+
+def search_terms(text):
+    """
+    Normalized words in a piece of text: footnote symbols dropped, lowercased, split on anything not a letter or digit
+    :rtype : list
+    """
+    return _WORDS.findall(FOOTNOTES.sub(' ', text).lower())
+
+
+def _column_terms(column_name):
+    words = set(search_terms(column_name))
+    key = normalize_column_name(column_name)
+    if key is not None:
+        words.update(search_terms(' '.join((series_name(key), key.statistic, key.period))))
+    return words
+
+
+def _row_terms(row_name):
+    words = set(search_terms(row_name))
+    place = area(row_name)
+    if place is not None:
+        words.update(search_terms(place.code))
+    return words
+
+
+class FilenameIndex(PickledIndex):
+    fields = ('files', 'postings')
+
+    def __init__(self, filename='search_index.pickle'):
+        """
+        :param filename: File the index is kept in. Loaded if it already exists.
+        """
+        self.files = []         # Filenames, by file number
+        self.file_ids = {}      # filename: file number
+        self.postings = {}      # word: set of file numbers
+        self._heading_terms = {}
+        PickledIndex.__init__(self, filename)
+
+    def load_state(self, state):
+        PickledIndex.load_state(self, state)
+        self.file_ids = dict((name, i) for i, name in enumerate(self.files))
+
+    def __contains__(self, filename):
+        return filename in self.file_ids
+
+    def __len__(self):
+        return len(self.files)
+
+    def _terms(self, heading, terms_of):
+        # The same few hundred headings turn up in every file, so each is only broken into words once
+        try:
+            return self._heading_terms[heading]
+        except KeyError:
+            words = self._heading_terms[heading] = terms_of(heading)
+            return words
+
+    def add(self, parsed):
+        """
+        Index one parsed file (TabFileParser or any subclass). Files already in the index are skipped.
+        """
+        filename = parsed.metadata['filename']
+        if filename in self.file_ids:
+            return
+        file_id = self.file_ids[filename] = len(self.files)
+        self.files.append(filename)
+
+        table_data = parsed.table_data
+        words = set()
+        for column_name in table_data:
+            words |= self._terms(column_name, _column_terms)
+        for row_name in row_names(table_data):
+            words |= self._terms(row_name, _row_terms)
+        for word in words:
+            self.postings.setdefault(word, set()).add(file_id)
+
+    def update(self, filename_list, filepath='.', processes=None, cache=None):
+        """
+        Bring the index up to date with a list of files, parsing only the ones it hasn't seen yet (see batch_parse).
+        :return: List of (filename, error) for files that couldn't be parsed
+        """
+        parsed_data, failures = self.parse_unseen(filename_list, filepath=filepath, processes=processes, cache=cache)
+        for parsed in parsed_data:
+            self.add(parsed)
+        return failures
+
+    def search(self, searchterm):
+        """
+        Names of the files whose headings contain every word of the search term (case doesn't matter), in name order
+        :rtype : list
+        """
+        words = set(search_terms(searchterm))
+        if not words:
+            return []
+        postings = sorted((self.postings.get(word, set()) for word in words), key=len)
+        file_ids = postings[0].intersection(*postings[1:])
+        return sorted(self.files[i] for i in file_ids)
+
+
+def load_index(index_filename):
+    """
+    The FilenameIndex saved in index_filename, loaded once and then reused until the file changes
+    :rtype : FilenameIndex
+    """
+    mtime = os.path.getmtime(index_filename)
+    if index_filename not in _loaded or _loaded[index_filename][0] != mtime:
+        _loaded[index_filename] = mtime, FilenameIndex(index_filename)
+    return _loaded[index_filename][1]
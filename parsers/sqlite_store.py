@@ -0,0 +1,185 @@
+#! /usr/bin/env python
+__author__ = 'Andrew Boughton and the A2 Hack for Change team'
+# Load parsed tab files into a SQLite database, one row per datapoint:
+#   (date, year, week, table, disease, statistic, geography, geography ID, value, code)
+# so that a time series becomes an index lookup instead of a parse of every file in the archive.
+#
+#   python sqlite_store.py --directory ../tabdatafiles --database ../mmwr.sqlite
+#
+# then, from python:
+#   conn = connect('../mmwr.sqlite')
+#   query_timeseries(conn, 'Syphilis, primary and secondary', 'Oreg.')
+
+import argparse
+import datetime
+import sqlite3
+
+from batch_parse import parse_files
+from column_names import UNKNOWN_STATISTIC, normalize_column_name, series_name
+from columnar_table import COUNT, NO_CASES, row_geography, row_names, typed_column
+from geography import UNMAPPED, geography_id
+from parse_table2_tabfiles import get_filenames_in_directory
+from search_index import FilenameIndex
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    date TEXT NOT NULL,             -- week ending date, YYYY-MM-DD
+    year INTEGER NOT NULL,          -- MMWR year and week
+    week INTEGER NOT NULL,
+    table_name TEXT NOT NULL,       -- e.g. 2H
+    disease TEXT NOT NULL,          -- canonical name from column_names.py, e.g. Syphilis, primary and secondary
+    statistic TEXT NOT NULL,        -- current week, cumulative YYYY, previous 52 weeks median/maximum
+    geography TEXT NOT NULL,        -- reporting area, as labelled in the file
+    geography_id INTEGER NOT NULL,  -- reporting area ID from geography.py, the same whatever the label; -1 if unknown
+    value INTEGER,                  -- NULL unless the cell held a number (or "-", meaning 0 cases)
+    code INTEGER NOT NULL,          -- cell code from columnar_table: why a value is or isn't there
+    filename TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS observations_series ON observations (disease, geography_id, date);
+CREATE INDEX IF NOT EXISTS observations_file ON observations (filename);
+
+CREATE TABLE IF NOT EXISTS files (
+    filename TEXT PRIMARY KEY,
+    date TEXT,
+    year INTEGER,
+    week INTEGER,
+    table_name TEXT,
+    ingested TEXT
+);
+"""
+
+def split_column_name(column_name):
+    """
+    Split a column name into (disease, statistic), using the canonical names from column_names.py so that a disease
+    keeps the same name across years whatever its header said. Returns None for columns that don't hold data
+    (Reporting Area). Columns whose statistic isn't recognised get the statistic 'unknown'.
+    :rtype : tuple
+    """
+    key = normalize_column_name(column_name)
+    if key is None:
+        return None
+    if key.statistic == 'count':
+        statistic = 'current week'
+    elif key.statistic == 'cumulative':
+        statistic = 'cumulative ' + key.period
+    elif key.statistic == UNKNOWN_STATISTIC:
+        statistic = UNKNOWN_STATISTIC
+    else:
+        statistic = 'previous 52 weeks ' + key.statistic
+    return series_name(key), statistic
+
+
+def connect(database):
+    """
+    Open (and create, if needed) a database of observations
+    :rtype : sqlite3.Connection
+    """
+    conn = sqlite3.connect(database)
+    conn.text_factory = str
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def observation_rows(parsed):
+    """
+    Yield one observations row per datapoint in a parsed file (TabFileParser or any subclass)
+    """
+    metadata = parsed.metadata
+    date = metadata['date'].isoformat()
+    year, week = metadata['year_and_week']
+    table_name = metadata['table_name']
+    filename = metadata['filename']
+    table_data = parsed.table_data
+    rows, row_ids = row_names(table_data), row_geography(table_data)[0]
+
+    for column_name in table_data:
+        split = split_column_name(column_name)
+        if split is None:
+            continue
+        disease, statistic = split
+        counts, codes = typed_column(table_data, column_name)
+        for row_name, row_id, count, code in zip(rows, row_ids, counts, codes):
+            yield (date, year, week, table_name, disease, statistic, row_name, row_id,
+                   count if code in (COUNT, NO_CASES) else None, code, filename)
+
+
+def ingest_parsed(conn, parsed_data, files_per_transaction=200, search_index=None):
+    """
+    Write parsed files into the database. Rows are inserted with executemany, many files per transaction. Files
+    that were loaded before are replaced, so re-ingesting a revised week is safe.
+    :param conn: Connection from connect()
+    :param parsed_data: List of parsed objects
+    :param files_per_transaction: Number of files to load per transaction
+    :param search_index: A FilenameIndex (see search_index.py) to add the files to as well. Not saved here.
+    :return: Number of observations written
+    """
+    written = 0
+    for start in xrange(0, len(parsed_data), files_per_transaction):
+        batch = parsed_data[start:start + files_per_transaction]
+        with conn:
+            filenames = [(p.metadata['filename'],) for p in batch]
+            conn.executemany('DELETE FROM observations WHERE filename = ?', filenames)
+            for parsed in batch:
+                rows = list(observation_rows(parsed))
+                conn.executemany('INSERT INTO observations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+                written += len(rows)
+            conn.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)',
+                             [(p.metadata['filename'],
+                               p.metadata['date'].isoformat(),
+                               p.metadata['year_and_week'][0],
+                               p.metadata['year_and_week'][1],
+                               p.metadata['table_name'],
+                               datetime.datetime.utcnow().isoformat()) for p in batch])
+        if search_index is not None:
+            for parsed in batch:
+                search_index.add(parsed)
+    return written
+
+
+def ingest_files(conn, filename_list, filepath='.', processes=None, cache=None, search_index=None):
+    """
+    Parse a list of tab files (in parallel, see batch_parse) and load them into the database
+    :return: (number of observations written, list of (filename, error) for files that couldn't be parsed)
+    """
+    parsed_data, failures = parse_files(filename_list, filepath=filepath, processes=processes, cache=cache)
+    return ingest_parsed(conn, parsed_data, search_index=search_index), failures
+
+
+def query_timeseries(conn, disease, geography, statistic='current week'):
+    """
+    The SQL equivalent of create_timeseries: one (date, value, code) tuple per week that has the given
+    disease/statistic, in date order. Answered from the (disease, geography_id, date) index, so any spelling of a
+    reporting area ('Upstate N.Y.' or 'N.Y. (Upstate)') finds every year of it.
+    :rtype : list
+    """
+    row_id = geography_id(geography)
+    if row_id == UNMAPPED:
+        return conn.execute('SELECT date, value, code FROM observations '
+                            'WHERE disease = ? AND geography = ? AND statistic = ? ORDER BY date',
+                            (disease, geography, statistic)).fetchall()
+    return conn.execute('SELECT date, value, code FROM observations '
+                        'WHERE disease = ? AND geography_id = ? AND statistic = ? ORDER BY date',
+                        (disease, row_id, statistic)).fetchall()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load MMWR tab files into a SQLite database')
+    parser.add_argument('--directory', default='../tabdatafiles', help='folder of tab files to load')
+    parser.add_argument('--pattern', default='*.tab', help='filename pattern to match in --directory')
+    parser.add_argument('--database', default='../mmwr.sqlite', help='SQLite database to load into')
+    parser.add_argument('--processes', type=int, default=None, help='parser processes (default: one per core)')
+    parser.add_argument('--search-index', help='also add the files to this filename search index (see search_index.py)')
+    args = parser.parse_args()
+
+    conn = connect(args.database)
+    search_index = FilenameIndex(args.search_index) if args.search_index else None
+    filename_list = get_filenames_in_directory(args.directory, pattern=args.pattern)
+    written, failures = ingest_files(conn, filename_list, filepath=args.directory, processes=args.processes,
+                                     search_index=search_index)
+    if search_index is not None:
+        search_index.save()
+    print 'Loaded {0} observations from {1} files ({2} could not be parsed)'.format(
+        written, len(filename_list) - len(failures), len(failures))
+    for filename, error in failures:
+        print 'Could not parse', filename
@@ -0,0 +1,197 @@
+#! /usr/bin/env python
+__author__ = 'Andrew Boughton and the A2 Hack for Change team'
+# Packs a whole archive of tab files into one big file, so that reading all of them is one sequential read instead of
+# ~8k small opens. Two files make up an archive:
+#   archive.tabpack       every tab file's contents, back to back
+#   archive.tabpack.idx   one line per file: year, week, table name, offset and length in the .tabpack file
+# Files are only ever appended (a table that's fetched again is added again, and the later copy wins), so the crawler
+# can write straight into an archive while it runs:
+#   CrawlTables(startyear=1996, endyear=2013, startweek=1, endweek=52, archive='../mmwr.tabpack')
+# or an existing folder of tab files can be packed:
+#   python tab_archive.py --directory ../tabdatafiles --archive ../mmwr.tabpack
+#
+# Reading goes through mmap, and an open TabArchive can be passed as the filepath wherever a folder name is accepted:
+#   archive = TabArchive('../mmwr.tabpack')
+#   parsed_data = [ColumnarTabFileParser(f, filepath=archive) for f in archive.filenames()]
+
+import argparse
+import mmap
+import os
+import threading
+
+from parse_table2_tabfiles import get_filenames_in_directory, parse_filename
+
+# Archives already opened in this process, by path (see open_archive)
+_open_archives = {}
+
+
+def tab_filename(key):
+    """
+    Standard tab file name for a (year, week, table name) key
+    """
+    return '{0}_wk{1:02}_table{2}.tab'.format(*key)
+
+
+def read_index(path):
+    """
+    Read an archive's index file into {(year, week, table name): (offset, length)}. Later lines replace earlier ones.
+    :rtype : dict
+    """
+    index = {}
+    if not os.path.exists(path + '.idx'):
+        return index
+    with open(path + '.idx', 'rb') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) != 5:
+                # Half-written last line from a crawl that was interrupted- the data it points to may be incomplete
+                continue
+            year, week, table_name, offset, length = fields
+            index[(int(year), int(week), table_name)] = (int(offset), int(length))
+    return index
+
+
+class TabArchiveWriter(object):
+    def __init__(self, path):
+        """
+        Open an archive for appending (created if needed). Safe to share between threads.
+        :param path: Name of the .tabpack file. The index is kept next to it, in path + '.idx'
+        """
+        self.path = path
+        self.index = read_index(path)
+        self._data = open(path, 'ab')
+        self._index = open(path + '.idx', 'ab')
+        self._lock = threading.Lock()
+
+    def add(self, year, week, table_name, contents):
+        """
+        Append one tab file's contents. The data is flushed before its index line is written, so an index line never
+         points past the end of the data.
+        """
+        with self._lock:
+            self._data.seek(0, os.SEEK_END)
+            offset = self._data.tell()
+            self._data.write(contents)
+            self._data.flush()
+            self._index.write('{0}\t{1}\t{2}\t{3}\t{4}\n'.format(year, week, table_name, offset, len(contents)))
+            self._index.flush()
+            self.index[(year, week, table_name)] = (offset, len(contents))
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def add_file(self, filename, filepath='.'):
+        """
+        Append a tab file from disk, going by its standard name ({year}_wk{week}_table{name}.tab)
+        """
+        with open(os.path.join(filepath, filename), 'rb') as f:
+            self.add(*(parse_filename(filename) + (f.read(),)))
+
+    def close(self):
+        self._data.close()
+        self._index.close()
+
+
+class TabArchive(object):
+    def __init__(self, path):
+        """
+        Open an archive for reading. Entries added after it was opened aren't seen; open it again to pick them up.
+        :param path: Name of the .tabpack file
+        """
+        self.path = path
+        self.index = read_index(path)
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            # mmap can't map an empty file
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else ''
+
+    def __reduce__(self):
+        # Worker processes (see batch_parse) map the archive themselves, once each, instead of being sent its contents
+        return open_archive, (self.path,)
+
+    def keys(self):
+        return sorted(self.index)
+
+    def filenames(self):
+        """
+        Standard tab file names of everything in the archive, in (year, week, table) order
+        :rtype : list
+        """
+        return [tab_filename(key) for key in self.keys()]
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def _locate(self, key):
+        if isinstance(key, basestring):
+            key = parse_filename(key)
+        return self.index[key]
+
+    def get(self, key):
+        """
+        One file's contents as a buffer over the mapped archive (no copy is made)
+        :param key: (year, week, table name), or a standard tab file name
+        """
+        offset, length = self._locate(key)
+        return buffer(self._data, offset, length)
+
+    def read(self, key):
+        """
+        One file's contents as a string
+        """
+        offset, length = self._locate(key)
+        return self._data[offset:offset + length]
+
+    def readlines(self, key):
+        """
+        One file as a list of lines, with line endings removed (what TabFileParser.load_file returns)
+        :rtype : list
+        """
+        return self.read(key).splitlines()
+
+    def lines(self, key):
+        """
+        Yield one file's lines one at a time, straight from the mapped archive, e.g. for a StreamingTabFileParser:
+            StreamingTabFileParser(archive.lines(filename), filename=filename)
+        """
+        offset, length = self._locate(key)
+        end = offset + length
+        data = self._data
+        while offset < end:
+            newline = data.find('\n', offset, end)
+            if newline == -1:
+                newline = end
+            yield data[offset:newline].rstrip('\r')
+            offset = newline + 1
+
+    def close(self):
+        if self._data:
+            self._data.close()
+
+
+def open_archive(path):
+    """
+    A TabArchive for the given path, reusing one already opened in this process
+    :rtype : TabArchive
+    """
+    if path not in _open_archives:
+        _open_archives[path] = TabArchive(path)
+    return _open_archives[path]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pack a folder of MMWR tab files into a single archive')
+    parser.add_argument('--directory', default='../tabdatafiles', help='folder of tab files to pack')
+    parser.add_argument('--pattern', default='*.tab', help='filename pattern to match in --directory')
+    parser.add_argument('--archive', default='../mmwr.tabpack', help='archive to add the files to')
+    args = parser.parse_args()
+
+    writer = TabArchiveWriter(args.archive)
+    filename_list = get_filenames_in_directory(args.directory, pattern=args.pattern)
+    for filename in filename_list:
+        writer.add_file(filename, args.directory)
+    writer.close()
+    print 'Packed {0} files into {1}'.format(len(filename_list), args.archive)
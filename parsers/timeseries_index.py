@@ -0,0 +1,128 @@
+__author__ = 'Andrew Boughton and the A2 Hack for Change team'
+# Answer many time series questions over a parsed archive without scanning every file for each one.
+# create_timeseries looks at every parsed file to produce one (column, row) series; building a dashboard with it means
+# hundreds of full passes. TimeSeriesIndex instead builds an inverted index once (column -> the weeks/files that
+# have it, reporting area -> the files that have it), and then answers whole families of series in one call, e.g.
+#   index = TimeSeriesIndex(parsed_data)
+#   by_state = index.series(['Syphillis, primary & secondary current week'])     # every reporting area, one disease
+#   by_disease = index.series(rows=['Oreg.'])                                     # every column, one reporting area
+# Each series is a pair of arrays (counts, codes) lined up with index.weeks, one slot per week in the archive.
+# Rows are matched by geography ID (see geography.py), as in create_timeseries and sqlite_store, so 'Upstate N.Y.' and
+# 'N.Y. (Upstate)' are one series whichever spelling is asked for. Labels that aren't known areas are matched as-is.
+# Columns are matched the same way, by their ColumnKey (see column_names.py): asking for 'Syphillis, primary & secondary
+# current week' also finds the years that spelled it 'Syphilis (Primary and Secondary)'. A ColumnKey can be asked for
+# directly, too.
+
+from array import array
+from collections import defaultdict
+
+from column_names import ColumnKey, normalize_column_name
+from columnar_table import NO_DATA, row_geography, row_names, typed_column
+from geography import UNMAPPED, geography_id
+
+
+def _column_key(column_name):
+    # Data columns are keyed by their ColumnKey, anything else (Reporting Area) by its name
+    if isinstance(column_name, ColumnKey):
+        return column_name
+    return normalize_column_name(column_name) or column_name
+
+
+def _row_key(row_name):
+    # Known reporting areas are keyed by geography ID, anything else by its label
+    row_id = geography_id(row_name)
+    return row_name if row_id == UNMAPPED else row_id
+
+
+class TimeSeriesIndex(object):
+    def __init__(self, parsed_objects):
+        """
+        :param parsed_objects: List of TabFileParser objects (ColumnarTabFileParser is fastest)
+        """
+        self.parsed = list(parsed_objects)
+
+        # One slot per distinct MMWR week, in order. Several tables from the same week share a slot.
+        week_of_file = [p.metadata['year_and_week'] for p in self.parsed]
+        self.weeks = sorted(set(week_of_file))
+        self.week_position = dict((week, i) for i, week in enumerate(self.weeks))
+        self.dates = [None] * len(self.weeks)
+
+        self.column_postings = defaultdict(list)  # column key (see _column_key): (week position, file, file's name)
+        self.column_labels = {}                  # column key: name the last file with that column used for it
+        self.row_postings = defaultdict(set)     # row key (see _row_key): files that have it
+        self.row_labels = {}                     # row key: label the last file with that row used for it
+        self.row_positions = []                  # Per file: {row key: position in the file's rows}
+        for f, parsed in enumerate(self.parsed):
+            position = self.week_position[week_of_file[f]]
+            self.dates[position] = parsed.metadata['date']
+            table_data = parsed.table_data
+            for column_name in table_data:
+                key = _column_key(column_name)
+                self.column_postings[key].append((position, f, column_name))
+                self.column_labels[key] = column_name
+            positions = {}
+            for i, (row_name, row_id) in enumerate(zip(row_names(table_data), row_geography(table_data)[0])):
+                key = row_name if row_id == UNMAPPED else row_id
+                positions[key] = i
+                self.row_labels[key] = row_name
+                self.row_postings[key].add(f)
+            self.row_positions.append(positions)
+
+    def column_names(self):
+        """
+        Every column in the archive. A column spelled differently in different years is listed once, under the name the
+         last file with it used.
+        """
+        return sorted(self.column_labels.itervalues())
+
+    def row_names(self, column_names=None):
+        """
+        Every row in the archive, or just the ones that appear in files containing the given columns. A place spelled
+         differently in different years is listed once, under the label the last file with it used.
+        """
+        if column_names is None:
+            return sorted(self.row_labels.itervalues())
+        files = set(f for column_name in column_names
+                    for position, f, name in self.column_postings.get(_column_key(column_name), ()))
+        return sorted(self.row_labels[key] for key, row_files in self.row_postings.iteritems() if row_files & files)
+
+    def series(self, column_names=None, rows=None):
+        """
+        Get every (column, row) series for the given columns and rows at once.
+
+        Returns {(column name, row name): (counts, codes)}, where counts and codes are arrays lined up with .weeks.
+        Codes are the cell codes from columnar_table; weeks where the column or row doesn't appear have code NO_DATA,
+        and counts are 0 wherever the code says there is no number.
+        :param column_names: Columns to get series for, by any spelling of their name or by ColumnKey (default: every
+            column that appears alongside the rows, or every column if rows isn't given either)
+        :param rows: Rows to get series for, by any spelling of their label (default: every row that appears alongside
+            the columns)
+        :rtype : dict
+        """
+        if column_names is None:
+            if rows is None:
+                column_names = self.column_names()
+            else:
+                files = set(f for row_name in rows for f in self.row_postings.get(_row_key(row_name), ()))
+                column_names = sorted(self.column_labels[key] for key, postings in self.column_postings.iteritems()
+                                      if any(f in files for position, f, name in postings))
+        if rows is None:
+            rows = self.row_names(column_names)
+        row_keys = [(row_name, _row_key(row_name)) for row_name in rows]
+
+        nweeks = len(self.weeks)
+        results = {}
+        for column_name in column_names:
+            per_row = [(row_name, key, array('i', [0]) * nweeks, array('b', [NO_DATA]) * nweeks)
+                       for row_name, key in row_keys]
+            for position, f, name in self.column_postings.get(_column_key(column_name), ()):
+                counts, codes = typed_column(self.parsed[f].table_data, name)
+                positions = self.row_positions[f]
+                for row_name, key, out_counts, out_codes in per_row:
+                    i = positions.get(key)
+                    if i is not None:
+                        out_counts[position] = counts[i]
+                        out_codes[position] = codes[i]
+            for row_name, key, out_counts, out_codes in per_row:
+                results[(column_name, row_name)] = (out_counts, out_codes)
+        return results
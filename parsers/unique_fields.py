@@ -1,7 +1,10 @@
 __author__ = 'Andrew Boughton and the A2 Hack for Change team'
 
 # Find the unique row and column names across all fields in a given file
+# Kept in a catalog on disk (see field_catalog.py), so each run only has to parse files that arrived since the last one
 from parse_table2_tabfiles import *
+from field_catalog import FieldCatalog
+from parse_cache import ParseCache
 
 # Tables I, J, and K were added only in 2010
 #filename_list = get_tables_timerange(startyear=2010,endyear=2013, startweek=1, endweek=21, tablename="2K")
@@ -10,25 +13,26 @@ from parse_table2_tabfiles import *
 filename_list = get_filenames_in_directory('../tabdatafiles', pattern='2*_wk*_table2*.tab')
 print len(filename_list)
 
-# Load and parse all the files in question
+catalog = FieldCatalog('../field_catalog.pickle')
 if filename_list:
-    parsed_data = [TabFileParser(f, filepath='../tabdatafiles') for f in filename_list]
+    # Parses (spread across every core) only the files the catalog hasn't seen yet
+    changes, failures = catalog.update(filename_list, filepath='../tabdatafiles', cache=ParseCache('../parse_cache'))
+    catalog.save()
+    for filename, error in failures:
+        print 'Could not parse', filename
+    for filename in sorted(changes):
+        print filename, 'added', len(changes[filename][0]), 'column and', len(changes[filename][1]), 'row headings'
 
-# Store all unique row and column headings
-col_headings = set()
-row_headings = set()
 
-for f in parsed_data:
-    these_cn = f.table_data.keys()
-    these_rn = f.table_data[these_cn[0]].keys()
+def print_headings(headings):
+    # Heading, then the (year, week, table) it was first and last seen in, and how many files it appears in
+    for heading, sighting in sorted(headings.iteritems(), key=lambda item: item[1].first_seen):
+        print '{0!r:90} {1} - {2} ({3} files)'.format(heading, sighting.first_seen, sighting.last_seen, sighting.count)
 
-    col_headings.update(set(these_cn))
-    row_headings.update(set(these_rn))
-
-import pprint
-print len(col_headings), "col headings"
-pprint.pprint(col_headings)
+print ''
+print len(catalog.columns), "col headings"
+print_headings(catalog.columns)
 
 print ''
-print len(row_headings), 'row headings'
-pprint.pprint(row_headings)
+print len(catalog.rows), 'row headings'
+print_headings(catalog.rows)